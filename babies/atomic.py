@@ -0,0 +1,36 @@
+import os
+import threading
+from contextlib import contextmanager
+
+
+def _fsync_directory(dirpath):
+    fd = os.open(dirpath or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def open_atomically(filepath, mode="w", sync=True):
+    """
+    Open a temporary file to be written in place of filepath, once the context
+    exits the file is synced and replaces filepath so a crash or full disk
+    never leaves filepath truncated. Without sync the file still replaces
+    filepath whole but may be lost in a crash, which is fine for data that can
+    be recomputed.
+    """
+    tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as stream:
+            yield stream
+            if sync:
+                stream.flush()
+                os.fsync(stream.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if sync:
+        _fsync_directory(os.path.dirname(filepath))
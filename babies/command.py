@@ -1,6 +1,7 @@
 import sys
 import argparse
 import os
+from typing import TYPE_CHECKING, Optional
 
 from .media import (
     play_media,
@@ -9,17 +10,50 @@ from .media import (
     enqueue_media,
     dequeue_media,
     grep_media_record,
+    split_global_record,
+    migrate_series,
+    index_library,
+    probe_media,
+    print_global_record_stats,
     create_record_from_directory,
 )
-from .display import get_display, set_display
 from .db import Db
-from .youtube import search_youtube
-from .spotify import search_spotify
-from .config import Config
-from .input import ReadInput
+from .formatting import parse_date, parse_duration
+from .query import Query
+from .storage import STORAGES
 
+if TYPE_CHECKING:
+    from .input import ReadInput
 
-def run_babies():
+
+def _date_argument(value: str):
+    date = parse_date(value)
+    if date is None:
+        raise argparse.ArgumentTypeError(f"invalid date: {value}")
+    return date
+
+
+def _duration_argument(value: str):
+    # allow durations like "90" or "1:30" in addition to "1:30:00"
+    parts = value.split(":")
+    try:
+        return parse_duration(":".join(["0"] * (3 - len(parts)) + parts))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration: {value}")
+
+
+# modules for talking to X, dbus and web APIs, libmpv and xdg are slow to
+# import so they are only imported by the subcommands that use them, see
+# benchmarks/import_time.py
+
+
+def _get_config():
+    from .config import Config
+
+    return Config()
+
+
+def run_babies(argv=None):
     parser = argparse.ArgumentParser(description="enjoy your media")
 
     paths_help = (
@@ -37,16 +71,125 @@ def run_babies():
         action="store_true",
         help="force overwrite of existing database",
     )
+    create.add_argument(
+        "-u",
+        "--update",
+        action="store_true",
+        help="add videos that aren't in an existing database to the end of it",
+    )
+    create.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="include videos in subdirectories, e.g. one for each season",
+    )
 
     find = subparsers.add_parser(
         "find", help="find entry in global record", aliases=["f"]
     )
     find.add_argument(
-        "search_terms", help="regular expressions, all must match", nargs="+"
+        "search_terms", help="regular expressions, all must match", nargs="*"
     )
     find.add_argument(
         "-q", "--quiet", action="store_true", help="only show video names"
     )
+    find.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to parse the log when it needs indexing",
+    )
+    find.add_argument(
+        "-s",
+        "--since",
+        type=_date_argument,
+        help="only entries started at or after this date (e.g. 2024/03/01)",
+    )
+    find.add_argument(
+        "-u",
+        "--until",
+        type=_date_argument,
+        help="only entries started before this date",
+    )
+    find.add_argument(
+        "--ended-since",
+        type=_date_argument,
+        help="only entries ended at or after this date",
+    )
+    find.add_argument(
+        "--ended-until", type=_date_argument, help="only entries ended before this date"
+    )
+    find.add_argument("-t", "--title", help="regular expression matching the title")
+    find.add_argument("-c", "--comment", help="regular expression matching the comment")
+    find.add_argument(
+        "--longer-than",
+        type=_duration_argument,
+        help="only media longer than this duration (e.g. 1:00:00)",
+    )
+    find.add_argument(
+        "--shorter-than",
+        type=_duration_argument,
+        help="only media shorter than this duration",
+    )
+
+    stats = subparsers.add_parser(
+        "stats", help="show statistics from the global record", aliases=["st"]
+    )
+    stats.add_argument(
+        "search_terms", help="regular expressions, all must match", nargs="*"
+    )
+    stats.add_argument(
+        "-s", "--since", type=_date_argument, help="only entries started after this"
+    )
+    stats.add_argument(
+        "-u", "--until", type=_date_argument, help="only entries started before this"
+    )
+    stats.add_argument("-t", "--title", help="regular expression matching the title")
+    stats.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes used to parse the log when it needs indexing",
+    )
+
+    subparsers.add_parser(
+        "split_record",
+        help="split the global record into monthly segments",
+        aliases=["sr"],
+    )
+
+    index = subparsers.add_parser(
+        "index",
+        help="index the next media of every directory in the library",
+        aliases=["i"],
+    )
+    index.add_argument(
+        "roots",
+        help="library directories, defaults to library-roots from the config",
+        nargs="*",
+    )
+    index.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="keep the index up to date as the library changes",
+    )
+
+    migrate = subparsers.add_parser(
+        "migrate",
+        help="convert series dbs to another storage format",
+        aliases=["mg"],
+    )
+    migrate.add_argument("paths", help="paths to series directories", nargs="*")
+    migrate.add_argument(
+        "-f",
+        "--format",
+        choices=list(STORAGES),
+        default="json",
+        help="json is much faster to load, yaml is easier to edit by hand",
+    )
 
     watch = subparsers.add_parser(
         "watch",
@@ -69,6 +212,13 @@ def run_babies():
     watch.add_argument(
         "-p", "--position-events", action="store_true", help="log position events"
     )
+    watch.add_argument(
+        "-C",
+        "--continue",
+        action="store_true",
+        dest="continue_playing",
+        help="keep playing the next media at each path until one isn't finished",
+    )
 
     enqueue = subparsers.add_parser("enqueue", help="enqueue shows", aliases=["e"])
     enqueue.add_argument("queue_path", help="directory to story queue in")
@@ -106,6 +256,13 @@ def run_babies():
         help="do not filter out non-videos",
     )
     print_cmd.add_argument("-m", "--mtime", action="store_true", help="retrieve mtime")
+    print_cmd.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=8,
+        help="number of paths to resolve at once",
+    )
 
     path_help = "paths to video and/or directory containing series and or/video"
     record = subparsers.add_parser(
@@ -114,6 +271,27 @@ def run_babies():
     record.add_argument("path", help=path_help, type=str)
     record.add_argument("comment", help="comment to record with video", type=str)
 
+    probe = subparsers.add_parser(
+        "probe", help="cache the durations of videos", aliases=["pr"]
+    )
+    probe.add_argument("paths", help=paths_help, nargs="*")
+    probe.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="include videos in subdirectories",
+    )
+    probe.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of videos to probe at once",
+    )
+    probe.add_argument(
+        "-v", "--verbose", action="store_true", help="show durations and tracks"
+    )
+
     search_youtube_cmd = subparsers.add_parser(
         "search_youtube", help="search youtube", aliases=["syt"]
     )
@@ -145,6 +323,12 @@ def run_babies():
     )
     listen_command.add_argument("tracks", help="tracks to listen to", nargs="+")
 
+    subparsers.add_parser(
+        "serve",
+        help="run print, enqueue, dequeue, find and watch for other babies commands",
+        aliases=["sv"],
+    )
+
     get_display_command = subparsers.add_parser(
         "get_display", help="get current display", aliases=["gd"]
     )
@@ -157,7 +341,8 @@ def run_babies():
     )
     set_display_command.add_argument("display", help="new display name to set", nargs=1)
 
-    argv = sys.argv[1:]
+    if argv is None:
+        argv = sys.argv[1:]
     # if the first argument is a file then prepend the "watch" command
     if len(argv) and "." in argv[0]:
         argv = ["w"] + argv
@@ -174,21 +359,61 @@ def run_babies():
         paths = [os.getcwd()]
 
     subcommand = args.subcommand
-    read_input = ReadInput()
+    read_input: Optional["ReadInput"] = None
+
+    def get_read_input():
+        nonlocal read_input
+        if read_input is None:
+            from .input import ReadInput
+
+            read_input = ReadInput()
+        return read_input
 
     if subcommand is None:
-        play_media(read_input, os.getcwd())
+        play_media(get_read_input(), os.getcwd())
     elif subcommand == "listen" or subcommand == "l":
         for track in args.tracks:
-            play_media(read_input, track)
+            play_media(get_read_input(), track)
     elif subcommand == "create" or subcommand == "c":
         for path in paths:
             db = Db()
-            create_record_from_directory(db, path, args.force)
+            create_record_from_directory(
+                db, path, args.force, update=args.update, recursive=args.recursive
+            )
     elif subcommand == "find" or subcommand == "f":
-        grep_media_record(args.search_terms, args.quiet)
+        query = Query(
+            terms=args.search_terms,
+            title=args.title,
+            comment=args.comment,
+            since=args.since,
+            until=args.until,
+            ended_since=args.ended_since,
+            ended_until=args.ended_until,
+            longer_than=args.longer_than,
+            shorter_than=args.shorter_than,
+        )
+        grep_media_record(query, args.quiet, jobs=args.jobs)
+    elif subcommand == "stats" or subcommand == "st":
+        query = Query(
+            terms=args.search_terms,
+            title=args.title,
+            since=args.since,
+            until=args.until,
+        )
+        print_global_record_stats(query, jobs=args.jobs)
+    elif subcommand == "split_record" or subcommand == "sr":
+        split_global_record()
+    elif subcommand == "index" or subcommand == "i":
+        config = _get_config()
+        index_library(config, args.roots, watch=args.watch)
+    elif subcommand == "migrate" or subcommand == "mg":
+        migrate_series(paths, args.format)
     elif subcommand == "record" or subcommand == "r":
         record_media(args.path, args.comment)
+    elif subcommand == "probe" or subcommand == "pr":
+        probe_media(
+            paths, recursive=args.recursive, jobs=args.jobs, verbose=args.verbose
+        )
     elif subcommand == "enqueue" or subcommand == "e":
         enqueue_media(
             args.queue_path,
@@ -206,33 +431,58 @@ def run_babies():
             verbose=args.verbose,
             no_extension_filter=args.no_extension_filter,
             mtime=args.mtime,
+            jobs=args.jobs,
         )
+    elif subcommand == "serve" or subcommand == "sv":
+        from .server import serve
+
+        serve()
     elif subcommand == "search_youtube" or subcommand == "syt":
-        config = Config()
+        from .youtube import search_youtube
+
+        config = _get_config()
         search_youtube(config, args.search_terms, duration=args.duration, raw=args.raw)
     elif subcommand == "search_spotify" or subcommand == "ss":
-        config = Config()
+        from .spotify import search_spotify
+
+        config = _get_config()
         search_spotify(config, args.search_terms, limit=args.limit, raw=args.raw)
     elif subcommand == "get_display" or subcommand == "gd":
-        config = Config()
+        from .display import get_display
+
+        config = _get_config()
         get_display(config, verbose=args.verbose)
     elif subcommand == "set_display" or subcommand == "sd":
-        config = Config()
+        from .display import set_display
+
+        config = _get_config()
         set_display(config, args.display[0])
     else:
         night_mode = subcommand == "night" or subcommand == "n"
         dry_run = subcommand == "dryrun" or subcommand == "d"
         if night_mode or dry_run or subcommand == "watch" or subcommand == "w":
-            for path in paths:
-                play_media(
-                    read_input,
-                    path,
-                    dont_record=dry_run or args.dont_record,
-                    night_mode=night_mode or args.night_mode,
-                    sub_file=args.sub_file,
-                    comment=args.comment,
-                    title=args.title,
-                    position_events=args.position_events,
-                )
-
-    read_input.destroy()
+            from .videos import Player
+
+            dont_record = dry_run or args.dont_record
+            if args.continue_playing and dont_record:
+                raise ValueError("--continue needs viewings to be recorded")
+
+            # one player is used for every path
+            with Player() as player:
+                for path in paths:
+                    while play_media(
+                        get_read_input(),
+                        path,
+                        dont_record=dont_record,
+                        night_mode=night_mode or args.night_mode,
+                        sub_file=args.sub_file,
+                        comment=args.comment,
+                        title=args.title,
+                        position_events=args.position_events,
+                        player=player,
+                        continue_playing=args.continue_playing,
+                    ):
+                        pass
+
+    if read_input is not None:
+        read_input.destroy()
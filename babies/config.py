@@ -1,6 +1,6 @@
 from os import path
 from xdg import BaseDirectory
-from typing import Dict, Optional, Tuple, TypedDict
+from typing import Dict, List, Optional, Tuple, TypedDict
 from datetime import datetime
 
 from .yaml import load_yaml_file, save_yaml_file
@@ -39,6 +39,12 @@ class Config:
             raise ValueError("No youtube-api-key configuration element found")
         return api_key
 
+    def get_library_roots(self) -> List[str]:
+        roots = self.config.get("library-roots", None)
+        if not roots:
+            raise ValueError("No library-roots configuration element found")
+        return [path.expanduser(root) for root in roots]
+
     def get_displays(self) -> ConfigDisplays:
         return self.config.get("displays", {})
 
@@ -1,8 +1,15 @@
 import os
-from typing import List, Dict, Optional
+from dataclasses import replace
+from typing import Dict, Iterator, List, Optional, Tuple
 from mypy_extensions import TypedDict
 
-from .yaml import load_yaml_file, save_yaml_file
+from .entry import SeriesEntry, Viewing
+from .lock import lock_file
+from .storage import DEFAULT_STORAGE, SeriesStorage, find_series_storage
+from .yaml import load_yaml_file, load_yaml_sequence_file, save_yaml_file
+from .record_index import GlobalRecordIndex
+from .global_record import GlobalRecord
+from .query import Query
 
 # set this when the end is unknown... assume it finished sometime
 UNKNOWN_END = "sometime at finished?"
@@ -16,97 +23,476 @@ class MediaEntry(TypedDict, total=False):
     comment: str
     title: str
     alias: str
+    series: str
     start: str
     end: str
 
 
-MediaDb = List[MediaEntry]
+MediaDb = List[SeriesEntry]
+
+
+# the journal is folded back into the series db once it grows past this
+JOURNAL_COMPACT_BYTES = 64 * 1024
+
+# (size, mtime, inode) of the series db followed by the same for its journal
+SeriesStat = Tuple[int, int, int, int, int, int]
+
+# stat, entries and next index (when it is known) of each series loaded by
+# this process keyed by absolute path, the entries are shared between every
+# Db that loads the series so they must not be modified in place
+_series_cache: Dict[str, Tuple[SeriesStat, MediaDb, bool, Optional[int]]] = {}
+
+
+def _get_media_path(entry: MediaEntry) -> Optional[str]:
+    return entry.get("video", entry.get("audio", None))
+
+
+def _stat_file(path: str) -> Tuple[int, int, int]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0, 0
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def _stat_series(dirpath: str) -> SeriesStat:
+    return _stat_file(Db.get_series_db_path(dirpath)) + _stat_file(
+        Db.get_series_journal_path(dirpath)
+    )
 
 
 class Db:
     def __init__(self):
         self.__video_db: MediaDb = []
         self.aliased_db: Optional[Db] = None
+        # the index of the next unwatched entry, None when the series is
+        # complete, only valid when __has_next_index is set
+        self.__next_index: Optional[int] = None
+        self.__has_next_index = False
+        # path and stat of the series when it was loaded, used to save the
+        # next index to the cursor file after it has been computed
+        self.__loaded_series: Optional[Tuple[str, SeriesStat]] = None
+        # stat of the series when it was last loaded or written, used to
+        # detect changes made by other processes
+        self.__series_stat: Optional[SeriesStat] = None
+        # set when __video_db is shared with the series cache
+        self.__shared = False
 
     def load_series(self, dirpath: str) -> bool:
-        db_path = Db.get_series_db_path(dirpath)
-        try:
-            self.__video_db = load_yaml_file(db_path)
+        storage = Db.get_series_storage(dirpath)
+        self.__has_next_index = False
+        self.__loaded_series = None
+        series_stat = _stat_series(dirpath)
+        self.__series_stat = series_stat
+
+        cached = _series_cache.get(os.path.abspath(dirpath), None)
+        if cached and cached[0] == series_stat:
+            _, self.__video_db, self.__has_next_index, self.__next_index = cached
+            self.__shared = True
+            if not self.__has_next_index:
+                self.__loaded_series = (dirpath, series_stat)
             return True
+
+        self.__shared = False
+        try:
+            self.__video_db = [
+                SeriesEntry.from_dict(entry)
+                for entry in storage.load(storage.get_path(dirpath))
+            ]
         except FileNotFoundError:
             self.__video_db = []
             return False
 
+        self.__replay_journal(dirpath)
+
+        cursor = Db.__load_cursor(dirpath)
+        if cursor and tuple(cursor["stat"]) == series_stat:
+            self.__next_index = cursor["next"]
+            self.__has_next_index = True
+        else:
+            self.__loaded_series = (dirpath, series_stat)
+        self.__cache_series(dirpath, series_stat)
+        return True
+
+    def __cache_series(self, dirpath: str, series_stat: SeriesStat) -> None:
+        _series_cache[os.path.abspath(dirpath)] = (
+            series_stat,
+            self.__video_db,
+            self.__has_next_index,
+            self.__next_index,
+        )
+        self.__shared = True
+
+    def __get_own_entries(self) -> MediaDb:
+        # copy the entries shared with the series cache before modifying them
+        if self.__shared:
+            self.__video_db = list(self.__video_db)
+            self.__shared = False
+        return self.__video_db
+
+    def __replay_journal(self, dirpath: str) -> None:
+        try:
+            operations = load_yaml_sequence_file(Db.get_series_journal_path(dirpath))
+        except FileNotFoundError:
+            return
+
+        # replaying is idempotent so that a journal left behind by an
+        # interrupted compaction doesn't record anything twice
+        media_set = self.get_series_media_set()
+        for operation in operations:
+            if not isinstance(operation, dict):
+                continue
+            if isinstance(operation.get("enqueue", None), dict):
+                entry = SeriesEntry.from_dict(operation["enqueue"])
+                if entry.media not in media_set:
+                    self.__video_db.append(entry)
+                    media_set.add(entry.media)
+                continue
+            if "index" not in operation or "media" not in operation:
+                continue
+
+            found = self.__find_entry(operation["index"], operation["media"])
+            if found is None:
+                # the entry was removed after the operation was journaled
+                continue
+            found.update(operation.get("set", {}))
+            viewing = operation.get("viewing", None)
+            if viewing:
+                viewing = Viewing.from_dict(viewing)
+                if viewing not in found.viewings:
+                    found.viewings.append(viewing)
+
+    def __find_entry(self, index: int, media: Optional[str]) -> Optional[SeriesEntry]:
+        if index < len(self.__video_db):
+            entry = self.__video_db[index]
+            if entry.media == media:
+                return entry
+        for entry in self.__video_db:
+            if entry.media == media:
+                return entry
+        return None
+
+    def __reload_if_changed(self, dirpath: str) -> None:
+        # must be called with the series locked
+        if _stat_series(dirpath) != self.__series_stat:
+            self.load_series(dirpath)
+
+    def __append_journal(self, dirpath: str, operations: List[dict]) -> None:
+        journal_path = Db.get_series_journal_path(dirpath)
+        save_yaml_file(journal_path, operations, "a")
+        if os.path.getsize(journal_path) > JOURNAL_COMPACT_BYTES:
+            self.write_series(dirpath)
+        else:
+            self.__series_stat = _stat_series(dirpath)
+            self.__save_cursor(dirpath, self.__series_stat)
+            self.__cache_series(dirpath, self.__series_stat)
+
     @staticmethod
-    def path_has_series_db(dirpath: str) -> bool:
-        db_path = Db.get_series_db_path(dirpath)
-        return os.path.isfile(db_path)
+    def __load_cursor(dirpath: str):
+        try:
+            cursor = load_yaml_file(Db.get_series_cursor_path(dirpath))
+        except (FileNotFoundError, ValueError):
+            return None
+        return cursor if isinstance(cursor, dict) and "stat" in cursor else None
 
-    def get_next_index_in_series(self):
-        for idx, show in enumerate(self.__video_db):
-            viewings = show.get("viewings", None)
-            if not viewings:
-                return idx
+    def __save_cursor(self, dirpath: str, series_stat: SeriesStat) -> None:
+        try:
+            # the cursor is recomputed when it is lost, so it isn't worth
+            # syncing, which is slow on network storage
+            save_yaml_file(
+                Db.get_series_cursor_path(dirpath),
+                {"stat": list(series_stat), "next": self.__next_index},
+                sync=False,
+            )
+        except OSError:
+            # the cursor is only an optimisation, e.g. the series may be on a
+            # read only mount
+            pass
 
-            # get duration component of end field
-            final_viewing = viewings[-1]["end"].split(" at ")[1]
+    @staticmethod
+    def path_has_series_db(dirpath: str) -> bool:
+        return find_series_storage(dirpath) is not None
 
+    def __find_next_index_in_series(self, start=0) -> Optional[int]:
+        for idx in range(start, len(self.__video_db)):
             # if the final viewing didn't complete the show then it is next
-            if final_viewing != "finished?" and final_viewing != show.get(
-                "duration", None
-            ):
+            if not self.__video_db[idx].is_finished():
                 return idx
 
         return None
 
+    def get_next_index_in_series(self):
+        if not self.__has_next_index:
+            self.__next_index = self.__find_next_index_in_series()
+            self.__has_next_index = True
+            if self.__loaded_series:
+                self.__save_cursor(*self.__loaded_series)
+                if self.__shared:
+                    self.__cache_series(*self.__loaded_series)
+                self.__loaded_series = None
+        return self.__next_index
+
     def get_next_in_series(self):
         next_index = self.get_next_index_in_series()
         if next_index is None:
             return None
         else:
             next_entry = self.__video_db[next_index]
-            alias = next_entry.get("alias", None)
-            if alias:
+            if next_entry.alias:
                 self.aliased_db = Db()
-                self.aliased_db.load_series(alias)
+                self.aliased_db.load_series(next_entry.alias)
             return next_entry
 
+    def get_following_in_series(self) -> Optional[SeriesEntry]:
+        """
+        Return the entry that will be next once the next entry is finished
+        """
+        next_index = self.get_next_index_in_series()
+        if next_index is None:
+            return None
+        following_index = self.__find_next_index_in_series(next_index + 1)
+        return None if following_index is None else self.__video_db[following_index]
+
     def prune_watched(self):
         next_index = self.get_next_index_in_series()
         if next_index:
             self.__video_db = self.__video_db[next_index:]
+            self.__next_index = 0
+        self.__loaded_series = None
 
-    def add_show_to_series(self, video_data):
-        self.__video_db.append(video_data)
+    def add_show_to_series(self, video_data: MediaEntry):
+        self.__get_own_entries().append(SeriesEntry.from_dict(video_data))
+        # an entry added after the next unwatched entry doesn't change it
+        if self.__next_index is None:
+            self.__has_next_index = False
+        self.__loaded_series = None
 
-    def write_series(self, dirpath):
-        filepath = Db.get_series_db_path(dirpath)
-        save_yaml_file(filepath, self.__video_db)
+    def enqueue_shows(
+        self, dirpath: str, entries: List[MediaEntry]
+    ) -> List[MediaEntry]:
+        """
+        Add entries to the end of the series, they are appended to the journal
+        rather than rewriting the series db. Entries that another process has
+        already enqueued are skipped, the entries added are returned.
+        """
+        with Db.lock_series(dirpath):
+            self.__reload_if_changed(dirpath)
+            media_set = self.get_series_media_set()
+            entries = [
+                entry for entry in entries if _get_media_path(entry) not in media_set
+            ]
+            for entry in entries:
+                self.add_show_to_series(entry)
+            if not Db.path_has_series_db(dirpath):
+                self.write_series(dirpath)
+            elif entries:
+                self.get_next_index_in_series()
+                self.__append_journal(
+                    dirpath, [{"enqueue": entry} for entry in entries]
+                )
+        return entries
 
-    def get_series_media_set(self):
-        return set(
-            map(
-                lambda entry: entry.get("video", entry.get("audio", None)),
-                self.__video_db,
+    def record_viewing(
+        self, dirpath: str, entry: SeriesEntry, viewing: Dict[str, str], **fields
+    ) -> bool:
+        """
+        Add a viewing to an entry of the series along with changes to its other
+        fields, this is appended to the journal rather than rewriting the
+        series db. The series is reloaded first if another process has changed
+        it, returns False if the entry is no longer in the series.
+        """
+        with Db.lock_series(dirpath):
+            index = next(
+                idx
+                for idx, candidate in enumerate(self.__video_db)
+                if candidate is entry
             )
+            self.__reload_if_changed(dirpath)
+            found = self.__find_entry(index, entry.media)
+            if found is None:
+                return False
+            self.__record_viewing(dirpath, found, viewing, fields)
+            return True
+
+    def __record_viewing(
+        self, dirpath: str, entry: SeriesEntry, viewing: Dict[str, str], fields
+    ) -> None:
+        index = next(
+            idx for idx, candidate in enumerate(self.__video_db) if candidate is entry
+        )
+        # find the next index before the entry changes so that a cursor saved
+        # for the series as it was loaded is correct
+        next_index = self.get_next_index_in_series()
+
+        # update a copy as the entry may be shared with the series cache
+        entry = replace(
+            entry,
+            viewings=entry.viewings + [Viewing.from_dict(viewing)],
+            extra=dict(entry.extra) if entry.extra else None,
+        )
+        entry.update(fields)
+        self.__get_own_entries()[index] = entry
+
+        # entries before the next unwatched entry are all complete, so the
+        # next index can only change from the entry that was viewed onwards
+        if next_index is None or index <= next_index:
+            self.__next_index = self.__find_next_index_in_series(
+                index if next_index is None else min(index, next_index)
+            )
+
+        self.__append_journal(
+            dirpath,
+            [
+                {
+                    "index": index,
+                    "media": entry.media,
+                    "set": fields,
+                    "viewing": viewing,
+                }
+            ],
         )
 
+    def write_series(self, dirpath, storage: Optional[SeriesStorage] = None):
+        """
+        Replace the series db with the entries in memory, callers that loaded
+        the series should hold its lock from loading it until it is written.
+        When storage is given the series db is moved to that format.
+        """
+        with Db.lock_series(dirpath):
+            old_storage = Db.get_series_storage(dirpath)
+            storage = storage or old_storage
+            storage.save(
+                storage.get_path(dirpath),
+                [entry.to_dict() for entry in self.__video_db],
+            )
+            old_path = old_storage.get_path(dirpath)
+            if storage is not old_storage and os.path.exists(old_path):
+                os.remove(old_path)
+
+            # everything in the journal is now in the series db
+            journal_path = Db.get_series_journal_path(dirpath)
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+
+            # the entries may have been modified since the next index was
+            # found, e.g. by recording a viewing, so find it again
+            self.__next_index = self.__find_next_index_in_series()
+            self.__has_next_index = True
+            self.__loaded_series = None
+            self.__series_stat = _stat_series(dirpath)
+            self.__save_cursor(dirpath, self.__series_stat)
+            self.__cache_series(dirpath, self.__series_stat)
+
+    def get_series_media_set(self):
+        return {entry.media for entry in self.__video_db}
+
+    @staticmethod
+    def get_series_stat(dirpath) -> SeriesStat:
+        return _stat_series(dirpath)
+
+    @staticmethod
+    def get_series_storage(dirpath) -> SeriesStorage:
+        return find_series_storage(dirpath) or DEFAULT_STORAGE
+
     @staticmethod
     def get_series_db_path(dirpath):
-        return os.path.join(dirpath, ".videos.yaml")
+        return Db.get_series_storage(dirpath).get_path(dirpath)
+
+    @staticmethod
+    def get_series_cursor_path(dirpath):
+        return os.path.join(dirpath, ".videos.cursor")
+
+    @staticmethod
+    def get_series_journal_path(dirpath):
+        return os.path.join(dirpath, ".videos.journal")
+
+    @staticmethod
+    def lock_series(dirpath):
+        """
+        Return a context manager that holds an exclusive lock on the series
+        """
+        return lock_file(os.path.join(dirpath, ".videos.lock"))
 
     def load_global_record(self):
-        self.__video_db = load_yaml_file(Db.get_global_record_db_path())
+        self.__video_db = list(map(SeriesEntry.from_dict, Db.iter_global_record()))
+        self.__has_next_index = False
+        self.__loaded_series = None
+
+    @staticmethod
+    def iter_global_record() -> Iterator[MediaEntry]:
+        return Db().find_in_global_record(Query())
 
     def get_matching_entries(self, filter_expression):
         return filter(filter_expression, self.__video_db)
 
     def filter_db(self, filter_expression):
         self.__video_db = list(self.get_matching_entries(filter_expression))
+        self.__has_next_index = False
+        self.__loaded_series = None
+
+    @staticmethod
+    def __refresh_global_record_index(query: Query, jobs: int):
+        """
+        Bring the parts of the global record index needed by the query up to
+        date and return it along with the sources the query should search
+        """
+        global_record = Db.get_global_record()
+        index = GlobalRecordIndex(global_record.get_index_path())
+        # the lock stops another process appending to the record or indexing
+        # the same entries between reading the indexed offsets and indexing
+        # what follows them
+        with global_record.lock():
+            all_sources = global_record.get_sources()
+            index.forget_sources_except([name for name, _ in all_sources])
+
+            if query.since is None and query.until is None:
+                index.refresh(all_sources, jobs)
+                return index, None
+
+            # only the segments that overlap the range need to be read
+            sources = global_record.get_sources(query.since, query.until)
+            index.refresh(sources, jobs)
+            return index, [name for name, _ in sources]
+
+    def find_in_global_record(self, query: Query, jobs=1) -> Iterator[MediaEntry]:
+        index, sources = Db.__refresh_global_record_index(query, jobs)
+        return index.find(query, sources)
+
+    def get_global_record_stats(self, query: Query, jobs=1):
+        index, sources = Db.__refresh_global_record_index(query, jobs)
+        return index.get_stats(query, sources)
 
     def append_global_record(self, record):
-        save_yaml_file(Db.get_global_record_db_path(), [record], "a")
+        global_record = Db.get_global_record()
+        with global_record.lock():
+            index = GlobalRecordIndex(global_record.get_index_path())
+            # only maintain an index that is up to date, a stale one is
+            # refreshed the next time it is searched
+            index_was_fresh = index.exists() and all(
+                index.is_fresh(source) for source in global_record.get_sources()
+            )
+            global_record.append(record)
+            compressed = global_record.compress_closed_segments()
+            if index_was_fresh:
+                for source in compressed:
+                    index.move_source(source)
+                index.refresh(global_record.get_sources())
+            index.close()
 
     @staticmethod
     def get_global_record_db_path():
         return os.path.expanduser("~/.videorecord.yaml")
+
+    @staticmethod
+    def get_library_index_path():
+        return os.path.expanduser("~/.videolibrary.sqlite")
+
+    @staticmethod
+    def get_probe_cache_path():
+        return os.path.expanduser("~/.videoprobe.sqlite")
+
+    @staticmethod
+    def get_global_record():
+        return GlobalRecord(
+            Db.get_global_record_db_path(), os.path.expanduser("~/.videorecord")
+        )
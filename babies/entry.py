@@ -0,0 +1,173 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .formatting import (
+    format_duration,
+    format_time_with_duration,
+    parse_duration,
+    parse_time_with_duration,
+)
+
+
+# fields of an entry that are stored as they are
+_ENTRY_KEYS = ("video", "audio", "alias", "title", "comment")
+
+# the position of a viewing that ended at an unknown time after finishing
+FINISHED = "finished?"
+
+
+def _parse_duration_text(text) -> Tuple[Optional[float], Any]:
+    """
+    Parse a duration written by format_duration, returns the duration along
+    with the original value when formatting the duration wouldn't give it back
+    """
+    if not isinstance(text, str):
+        return None, text
+    try:
+        duration = parse_duration(text)
+    except ValueError:
+        return None, text
+    return duration, None if format_duration(duration) == text else text
+
+
+@dataclass(slots=True)
+class Timestamp:
+    """
+    A "<date> at <position>" field of a viewing, the date and position are
+    None when they weren't recorded
+    """
+
+    date: Optional[datetime]
+    position: Optional[float]
+    # the original text when it can't be reproduced from the date and position
+    text: Optional[str] = None
+
+    @staticmethod
+    def parse(text) -> "Timestamp":
+        date, duration = parse_time_with_duration(text)
+        position, _ = _parse_duration_text(duration)
+        timestamp = Timestamp(date, position)
+        if timestamp.format() != text:
+            timestamp.text = text
+        return timestamp
+
+    def format(self):
+        if self.text is not None:
+            return self.text
+        if self.date is None or self.position is None:
+            return None
+        return format_time_with_duration(self.date, self.position)
+
+
+@dataclass(slots=True)
+class Viewing:
+    start: Timestamp
+    end: Timestamp
+    # any other fields such as a comment
+    extra: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Viewing":
+        extra = {
+            key: value for key, value in data.items() if key not in ("start", "end")
+        }
+        return Viewing(
+            Timestamp.parse(data.get("start", "")),
+            Timestamp.parse(data.get("end", "")),
+            extra or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"start": self.start.format(), "end": self.end.format()}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+@dataclass(slots=True)
+class SeriesEntry:
+    """
+    An entry of a series db, the duration and viewings are parsed when the
+    entry is loaded so they don't have to be parsed each time they are used
+    """
+
+    video: Optional[str] = None
+    audio: Optional[str] = None
+    alias: Optional[str] = None
+    title: Any = None
+    comment: Any = None
+    # duration in seconds
+    duration: Optional[float] = None
+    # the original duration when it can't be reproduced from the seconds
+    duration_text: Any = None
+    viewings: List[Viewing] = field(default_factory=list)
+    # any other fields
+    extra: Optional[Dict[str, Any]] = None
+    # the fields of the entry in the order they were written so that they
+    # are written back in the same order, including those that were null
+    keys: Tuple[str, ...] = field(default=(), compare=False)
+
+    @property
+    def media(self) -> Optional[str]:
+        return self.video if self.video is not None else self.audio
+
+    @staticmethod
+    def from_dict(data: Mapping[str, Any]) -> "SeriesEntry":
+        entry = SeriesEntry()
+        entry.update(data)
+        return entry
+
+    def update(self, data: Mapping[str, Any]) -> None:
+        """
+        Set fields from a dict in the form written to the series db
+        """
+        for key, value in data.items():
+            if key not in self.keys:
+                # a new tuple as entries copied with replace share it
+                self.keys += (key,)
+            if key == "duration":
+                self.duration, self.duration_text = _parse_duration_text(value)
+            elif key == "viewings":
+                self.viewings = [Viewing.from_dict(viewing) for viewing in value]
+            elif key in _ENTRY_KEYS:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def format_duration(self):
+        if self.duration_text is not None or self.duration is None:
+            return self.duration_text
+        return format_duration(self.duration)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        for key in _ENTRY_KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        duration = self.format_duration()
+        if duration is not None:
+            data["duration"] = duration
+        if self.viewings or "viewings" in self.keys:
+            data["viewings"] = [viewing.to_dict() for viewing in self.viewings]
+        if self.extra:
+            data.update(self.extra)
+        if not self.keys:
+            return data
+        ordered = {key: data.pop(key, None) for key in self.keys}
+        ordered.update(data)
+        return ordered
+
+    def is_finished(self) -> bool:
+        """
+        Whether the final viewing reached the end of the media
+        """
+        if not self.viewings:
+            return False
+        end = self.viewings[-1].end
+        if end.position is None:
+            return parse_time_with_duration(end.text)[1] == FINISHED
+        return end.position == self.duration
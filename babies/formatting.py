@@ -1,4 +1,5 @@
 from math import floor
+from datetime import datetime
 
 
 def format_duration(duration):
@@ -26,3 +27,28 @@ def format_date(date):
 
 def format_time_with_duration(time, duration):
     return format_date(time) + " at " + format_duration(duration)
+
+
+def parse_duration(duration):
+    hours, mins, secs = duration.split(":")
+    return float(hours) * 3600 + float(mins) * 60 + float(secs)
+
+
+def parse_date(text):
+    """
+    Parse a date written by format_date, returns None for dates that were
+    not recorded such as "unknown"
+    """
+    try:
+        return datetime.fromisoformat(str(text).replace("/", "-"))
+    except ValueError:
+        return None
+
+
+def parse_time_with_duration(text):
+    """
+    Split a string written by format_time_with_duration into the date and
+    the formatted duration
+    """
+    date, _, duration = str(text).partition(" at ")
+    return parse_date(date), duration
@@ -0,0 +1,219 @@
+import os
+import gzip
+import shutil
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from .atomic import open_atomically
+from .lock import lock_file
+from .formatting import format_date, parse_date, parse_time_with_duration
+from .yaml import load_yaml_file, save_yaml_file, iter_yaml_sequence_batches
+
+MANIFEST_FILE = "manifest.yaml"
+
+# gzip's default level, closed segments are compressed while a session is
+# being recorded so higher levels aren't worth the time they take
+COMPRESS_LEVEL = 6
+
+# name and path of a file holding part or all of the global record
+Source = Tuple[str, str]
+
+
+def get_record_date(record) -> Optional[datetime]:
+    date, _ = parse_time_with_duration(record.get("start", ""))
+    return date
+
+
+def _get_segment_name(date: datetime) -> str:
+    return date.strftime("%Y-%m")
+
+
+def _segment_overlaps(
+    segment, since: Optional[datetime], until: Optional[datetime]
+) -> bool:
+    if since is None and until is None:
+        return True
+    first = parse_date(segment.get("first", None))
+    last = parse_date(segment.get("last", None))
+    if first is None or last is None:
+        # none of the entries in the segment have a known date
+        return False
+    return (since is None or last >= since) and (until is None or first < until)
+
+
+def _add_to_segment(segment: dict, record) -> None:
+    segment["entries"] += 1
+    date = get_record_date(record)
+    if date is None:
+        return
+    first = parse_date(segment.get("first", None))
+    if first is None or date < first:
+        segment["first"] = format_date(date)
+    last = parse_date(segment.get("last", None))
+    if last is None or date > last:
+        segment["last"] = format_date(date)
+
+
+class GlobalRecord:
+    """
+    The log of every viewing session, either stored in a single file or
+    split into monthly segments listed in a manifest
+    """
+
+    def __init__(self, record_path: str, segments_path: str):
+        self.__record_path = record_path
+        self.__segments_path = segments_path
+
+    def lock(self):
+        """
+        Return a context manager that holds an exclusive lock on the record
+        while it is modified
+        """
+        return lock_file(os.path.splitext(self.__record_path)[0] + ".lock")
+
+    def __get_manifest_path(self) -> str:
+        return os.path.join(self.__segments_path, MANIFEST_FILE)
+
+    def is_segmented(self) -> bool:
+        return os.path.isfile(self.__get_manifest_path())
+
+    def get_index_path(self) -> str:
+        if self.is_segmented():
+            return os.path.join(self.__segments_path, "index.sqlite")
+        else:
+            return os.path.splitext(self.__record_path)[0] + ".sqlite"
+
+    def __load_manifest(self) -> List[dict]:
+        return load_yaml_file(self.__get_manifest_path()) or []
+
+    def __save_manifest(self, manifest: List[dict]) -> None:
+        save_yaml_file(self.__get_manifest_path(), manifest)
+
+    def __get_segment_source(self, segment) -> Source:
+        return segment["name"], os.path.join(self.__segments_path, segment["file"])
+
+    def get_sources(
+        self, since: Optional[datetime] = None, until: Optional[datetime] = None
+    ) -> List[Source]:
+        """
+        Return the files holding the record in the order they were written,
+        when since or until are given segments that only hold entries
+        outside of that range are skipped
+        """
+        if not self.is_segmented():
+            return [(os.path.basename(self.__record_path), self.__record_path)]
+
+        return [
+            self.__get_segment_source(segment)
+            for segment in self.__load_manifest()
+            if _segment_overlaps(segment, since, until)
+        ]
+
+    def append(self, record) -> Source:
+        """
+        Append a record and return the source it was written to
+        """
+        with self.lock():
+            if not self.is_segmented():
+                save_yaml_file(self.__record_path, [record], "a")
+                return os.path.basename(self.__record_path), self.__record_path
+
+            manifest = self.__load_manifest()
+            name = _get_segment_name(datetime.now())
+            if manifest and manifest[-1]["name"] >= name:
+                # never write before a later segment, this keeps the segments in
+                # the order that records were appended even if the clock jumps
+                segment = manifest[-1]
+            else:
+                segment = {"name": name, "file": f"{name}.yaml", "entries": 0}
+                manifest.append(segment)
+
+            source = self.__get_segment_source(segment)
+            save_yaml_file(source[1], [record], "a")
+            _add_to_segment(segment, record)
+            self.__save_manifest(manifest)
+            return source
+
+    def split(self) -> List[dict]:
+        """
+        Move the entries of a single file record into monthly segments
+        according to their start dates and return the new manifest
+        """
+        with self.lock():
+            if self.is_segmented():
+                raise ValueError("global record is already segmented")
+
+            os.makedirs(self.__segments_path, exist_ok=True)
+            monolith_index_path = self.get_index_path()
+            manifest: List[dict] = []
+            pending: List[dict] = []
+            name: Optional[str] = None
+
+            def write_pending():
+                filename = f"{name}.yaml"
+                segment = {"name": name, "file": filename, "entries": 0}
+                for record in pending:
+                    _add_to_segment(segment, record)
+                save_yaml_file(os.path.join(self.__segments_path, filename), pending)
+                manifest.append(segment)
+                pending.clear()
+
+            for _, records in iter_yaml_sequence_batches(self.__record_path):
+                for record in records:
+                    date = get_record_date(record)
+                    # entries are kept in their original order, so an entry is
+                    # never moved before the segment of the entry that preceded it
+                    # and entries without a date stay with their neighbours
+                    record_name = _get_segment_name(date) if date else None
+                    if record_name and (name is None or record_name > name):
+                        if name is not None:
+                            write_pending()
+                        name = record_name
+                    pending.append(record)
+
+            if pending:
+                name = name or _get_segment_name(datetime.now())
+                write_pending()
+
+            self.__save_manifest(manifest)
+            self.compress_closed_segments()
+            os.replace(self.__record_path, self.__record_path + ".bak")
+            if os.path.isfile(monolith_index_path):
+                os.remove(monolith_index_path)
+            return manifest
+
+    def compress_closed_segments(self) -> List[Source]:
+        """
+        Compress every segment other than the newest one, which is the only
+        segment still appended to, and return the sources that were moved
+        """
+        with self.lock():
+            if not self.is_segmented():
+                return []
+
+            manifest = self.__load_manifest()
+            compressed = []
+            for segment in manifest[:-1]:
+                if segment["file"].endswith(".gz"):
+                    continue
+
+                path = os.path.join(self.__segments_path, segment["file"])
+                segment["file"] += ".gz"
+                source = self.__get_segment_source(segment)
+                # the archive is synced before the manifest refers to it and
+                # the uncompressed segment is removed
+                with open(path, "rb") as src, open_atomically(source[1], "wb") as dest:
+                    with gzip.GzipFile(
+                        fileobj=dest, mode="wb", compresslevel=COMPRESS_LEVEL
+                    ) as archive:
+                        shutil.copyfileobj(src, archive)
+                compressed.append((source, path))
+
+            if compressed:
+                # only remove the uncompressed segments once the manifest no
+                # longer refers to them
+                self.__save_manifest(manifest)
+                for _, path in compressed:
+                    os.remove(path)
+
+            return [source for source, _ in compressed]
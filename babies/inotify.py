@@ -0,0 +1,103 @@
+import os
+import ctypes
+import ctypes.util
+import select
+import struct
+from typing import List, NamedTuple, Optional
+
+# event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+# changes to the contents of a watched directory
+DIRECTORY_EVENTS = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# room for many events each with a name up to NAME_MAX
+_READ_BYTES = 64 * 1024
+
+
+class InotifyEvent(NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    # name of the file within the watched directory, empty for events on the
+    # directory itself
+    name: str
+
+
+class Inotify:
+    """
+    Minimal wrapper around the Linux inotify API using ctypes so that no
+    extra dependency is needed
+    """
+
+    def __init__(self):
+        self.__libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self.__fd = self.__libc.inotify_init1(IN_CLOEXEC)
+        if self.__fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1: {os.strerror(errno)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self) -> None:
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch: {os.strerror(errno)}", path)
+        return wd
+
+    def remove_watch(self, wd: int) -> None:
+        # fails when the watch was already removed with the directory
+        self.__libc.inotify_rm_watch(self.__fd, wd)
+
+    def read_events(self, timeout: Optional[float] = None) -> List[InotifyEvent]:
+        """
+        Wait up to timeout seconds, or forever when it is None, for events and
+        return those available
+        """
+        readable, _, _ = select.select([self.__fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.__fd, _READ_BYTES)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, os.fsdecode(name)))
+        return events
@@ -48,6 +48,7 @@ class ReadInput:
         self.__keyqueue.clear()
 
         if not self.__started:
+            self.__started = True
             self.__read_keypresses()
 
     def stop(self):
@@ -102,9 +103,9 @@ class ReadInput:
 
     def __read_keypresses_for_non_tty(self):
         def readlines():
-            while True:
-                line = sys.stdin.readline().strip()
-                self.__handle_keypress(line)
+            # readline returns an empty string once the input is closed
+            for line in iter(sys.stdin.readline, ""):
+                self.__handle_keypress(line.strip())
 
         cmd_thread = Thread(target=readlines)
         cmd_thread.daemon = True
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, NamedTuple, Optional
+
+# bump this when the schema changes so that old indexes are rebuilt
+SCHEMA_VERSION = 1
+
+
+class LibraryEntry(NamedTuple):
+    """
+    The next media of a series or video directory as resolved when it was
+    indexed
+    """
+
+    path: str
+    # identifies the state of the files the entry was resolved from
+    stat: str
+    # whether the directory has a series db
+    series: bool
+    # path to the next media or None when resolving failed
+    media_path: Optional[str]
+    # the next entry of a series as written in its db, None for directories
+    # without a series db
+    media: Optional[str]
+    alias: bool
+    # mtime of the next media
+    mtime: Optional[float]
+    # the error resolving the media, e.g. the series is complete
+    error: Optional[str]
+
+
+class LibraryIndex:
+    """
+    SQLite index of the next media in each directory of the library, this is
+    kept up to date by "babies index --watch" so that commands don't have to
+    parse series dbs
+    """
+
+    def __init__(self, index_path: str):
+        self.__index_path = index_path
+        self.__conn: Optional[sqlite3.Connection] = None
+        # the connection is shared by the threads used by "babies print"
+        self.__lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.__index_path)
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn is None:
+            conn = sqlite3.connect(self.__index_path, check_same_thread=False)
+            # allow the daemon to write while other commands read
+            conn.execute("PRAGMA journal_mode = WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript(
+                    f"""
+                    DROP TABLE IF EXISTS library;
+                    CREATE TABLE library (
+                        path TEXT PRIMARY KEY,
+                        stat TEXT NOT NULL,
+                        series INTEGER NOT NULL,
+                        media_path TEXT,
+                        media TEXT,
+                        alias INTEGER NOT NULL,
+                        mtime REAL,
+                        error TEXT
+                    );
+                    PRAGMA user_version = {SCHEMA_VERSION};
+                    """
+                )
+            self.__conn = conn
+        return self.__conn
+
+    def close(self) -> None:
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+
+    def get(self, path: str) -> Optional[LibraryEntry]:
+        with self.__lock:
+            row = (
+                self.__connect()
+                .execute("SELECT * FROM library WHERE path = ?", (path,))
+                .fetchone()
+            )
+        return None if row is None else LibraryEntry(*row)
+
+    def put(self, entry: LibraryEntry) -> None:
+        with self.__lock, self.__connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO library VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                entry,
+            )
+
+    def remove(self, paths: Iterable[str]) -> None:
+        with self.__lock, self.__connect() as conn:
+            conn.executemany(
+                "DELETE FROM library WHERE path = ?", ((path,) for path in paths)
+            )
+
+    def get_paths_under(self, root: str) -> List[str]:
+        """
+        Return the indexed paths that are root or inside of it
+        """
+        prefix = os.path.join(root, "")
+        with self.__lock:
+            rows = (
+                self.__connect()
+                .execute(
+                    "SELECT path FROM library WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (root, len(prefix), prefix),
+                )
+                .fetchall()
+            )
+        return [path for (path,) in rows]
@@ -0,0 +1,41 @@
+import os
+import threading
+import fcntl
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# locks held by each thread mapped to their file descriptor and depth
+_held_locks: Dict[Tuple[int, str], List[int]] = {}
+
+
+@contextmanager
+def lock_file(path: str):
+    """
+    Hold an exclusive advisory lock on path, which is created if it doesn't
+    exist, until the context exits. The lock is held on a file separate from
+    the data it protects as the data is replaced rather than rewritten. Locks
+    are reentrant within a thread.
+    """
+    key = (threading.get_ident(), os.path.abspath(path))
+    held = _held_locks.get(key, None)
+    if held:
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+        return
+
+    # a lock taken through another file descriptor blocks even within the
+    # same process, so threads exclude each other
+    fd = os.open(key[1], os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        _held_locks[key] = [fd, 1]
+        try:
+            yield
+        finally:
+            del _held_locks[key]
+    finally:
+        # closing the file releases the lock
+        os.close(fd)
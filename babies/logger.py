@@ -43,6 +43,13 @@ class MpvLogger:
             else:
                 print(formatted_message, file=stderr if is_error else stdout)
 
+    def suspend(self):
+        """
+        Hold back logs other than errors until unsuspend is called
+        """
+        self.suspended = True
+        self.suspended_logs = []
+
     def unsuspend(self):
         self.suspended = False
         for log in self.suspended_logs:
@@ -1,18 +1,40 @@
 import sys
 import os
-import re
-from typing import List, Union, Tuple, Optional, Dict
+import time
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
-from subprocess import check_output
+from concurrent.futures import ThreadPoolExecutor
 
-from .formatting import format_duration, format_time_with_duration
-from .videos import watch_video
-from .spotify import listen_to_track
-from .input import ReadInput
+from .formatting import format_duration, format_time_with_duration, parse_duration
 from .db import Db, MediaEntry
+from .entry import SeriesEntry
+from .inotify import (
+    DIRECTORY_EVENTS,
+    IN_CREATE,
+    IN_DELETE,
+    IN_DELETE_SELF,
+    IN_IGNORED,
+    IN_ISDIR,
+    IN_MOVE_SELF,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    IN_ONLYDIR,
+    IN_Q_OVERFLOW,
+    Inotify,
+)
+from .library import LibraryEntry, LibraryIndex
+from .probe import Probe, ProbeCache
+from .query import Query
+from .storage import STORAGES
 from .yaml import yaml
 
-SHOW_EXTENSIONS = [
+if TYPE_CHECKING:
+    # these pull in libmpv, dbus and requests which most commands don't need
+    from .config import Config
+    from .input import ReadInput
+    from .videos import Player
+
+SHOW_EXTENSIONS = {
     "mkv",
     "avi",
     "mpg",
@@ -25,7 +47,7 @@ SHOW_EXTENSIONS = [
     "iso",
     "mov",
     "webm",
-]
+}
 
 
 def _is_url(path: str) -> bool:
@@ -50,10 +72,8 @@ def _get_media_entry_for_log(media_path: str) -> str:
 
 
 def _is_video(path):
-    for suffix in SHOW_EXTENSIONS:
-        if path.endswith("." + suffix):
-            return True
-    return False
+    _, dot, extension = path.rpartition(".")
+    return bool(dot) and extension in SHOW_EXTENSIONS
 
 
 def _find_candidate_in_directory(path: str) -> str:
@@ -69,9 +89,26 @@ def _find_candidate_in_directory(path: str) -> str:
         raise ValueError("multiple candidates: " + ", ".join(candidates))
 
 
+def _get_series_media_path(path: str, media_entry: SeriesEntry) -> str:
+    audio = media_entry.audio
+    if audio:
+        return audio
+
+    video = media_entry.video
+    if video is None:
+        raise ValueError("series entry has no video or audio")
+    alias = media_entry.alias
+    if _is_url(video):
+        return video
+    elif alias:
+        return os.path.join(path, alias, video)
+    else:
+        return os.path.join(path, video)
+
+
 def _path_to_media(
     db: Db, path: str, ignore_errors=False, verbose=False
-) -> Tuple[str, Optional[MediaEntry]]:
+) -> Tuple[str, Optional[SeriesEntry]]:
     """
     If path is a directory then load series into db and return next
     unwatched show else return path to file
@@ -84,20 +121,7 @@ def _path_to_media(
             if not media_entry:
                 raise ValueError("series is complete")
 
-            audio = media_entry.get("audio", None)
-            if audio:
-                media_path = audio
-            else:
-                video = media_entry["video"]
-                alias = media_entry.get("alias", None)
-                if _is_url(video):
-                    media_path = video
-                elif alias:
-                    media_path = os.path.join(path, alias, video)
-                else:
-                    media_path = os.path.join(path, video)
-
-            return media_path, media_entry
+            return _get_series_media_path(path, media_entry), media_entry
         else:
             return _find_candidate_in_directory(path), None
 
@@ -107,56 +131,119 @@ def _path_to_media(
         raise ValueError(f"No video found at {path}")
 
 
+def _get_library_stat(path: str) -> str:
+    # identifies the state of the files the next media of path is resolved from
+    if Db.path_has_series_db(path):
+        return "series " + " ".join(map(str, Db.get_series_stat(path)))
+    stat = os.stat(path)
+    return f"directory {stat.st_mtime_ns} {stat.st_ino}"
+
+
+_library: Optional[LibraryIndex] = None
+
+
+def _get_library() -> Optional[LibraryIndex]:
+    # the index isn't cached until it exists as "babies serve" may have been
+    # started before it was created
+    global _library
+    if _library is None:
+        library = LibraryIndex(Db.get_library_index_path())
+        if library.exists():
+            _library = library
+    return _library
+
+
+def _lookup_library(path: str) -> Optional[LibraryEntry]:
+    """
+    Return the indexed next media of a directory when the directory hasn't
+    changed since it was indexed
+    """
+    if _is_url(path) or _is_spotify(path):
+        return None
+    library = _get_library()
+    if library is None:
+        return None
+    path = os.path.abspath(path)
+    entry = library.get(path)
+    try:
+        if entry is None or entry.stat != _get_library_stat(path):
+            return None
+    except OSError:
+        return None
+    return entry
+
+
+def _update_library_entry(library: LibraryIndex, path: str) -> bool:
+    """
+    Index the next media of a directory, returns False when the directory
+    holds neither a series nor videos
+    """
+    series = Db.path_has_series_db(path)
+    stat = _get_library_stat(path)
+    if not series and not any(map(_is_video, os.listdir(path))):
+        library.remove([path])
+        return False
+
+    try:
+        media_path, media_entry = _path_to_media(Db(), path)
+    except ValueError as e:
+        library.put(LibraryEntry(path, stat, series, None, None, False, None, str(e)))
+        return True
+
+    mtime = None
+    if not _is_url(media_path) and not _is_spotify(media_path):
+        try:
+            mtime = os.path.getmtime(media_path)
+        except OSError:
+            pass
+
+    library.put(
+        LibraryEntry(
+            path,
+            stat,
+            series,
+            media_path,
+            media_entry.media if media_entry else None,
+            bool(media_entry and media_entry.alias),
+            mtime,
+            None,
+        )
+    )
+    return True
+
+
 def record_media(path, comment):
     db = Db()
     media_path, media_entry = _path_to_media(db, path)
 
-    duration = format_duration(
-        float(
-            check_output(
-                [
-                    "ffprobe",
-                    "-v",
-                    "error",
-                    "-show_entries",
-                    "format=duration",
-                    "-of",
-                    "default=noprint_wrappers=1:nokey=1",
-                    media_path,
-                ]
-            )
-        )
-    )
+    probe_cache = ProbeCache(Db.get_probe_cache_path())
+    duration = format_duration(probe_cache.get_duration(media_path))
 
     video_filename = _get_media_entry_for_log(media_path)
     start = "unknown at " + format_duration(0)
     end = "unknown at " + duration
-    db.append_global_record(
-        {
-            "video": video_filename,
-            "duration": duration,
-            "start": start,
-            "end": end,
-            "comment": comment,
-        }
+    record: MediaEntry = {"video": video_filename}
+    series = _get_series_path(path, media_entry)
+    if series:
+        record["series"] = series
+    record.update(
+        {"duration": duration, "start": start, "end": end, "comment": comment}
     )
+    db.append_global_record(record)
     print("recorded " + video_filename + " in global log with comment: " + comment)
 
     if media_entry:
-        media_entry["duration"] = duration
-        viewings = media_entry.setdefault("viewings", [])
-        viewings.append({"start": start, "end": end, "comment": comment})
-        db.write_series(path)
+        db.record_viewing(
+            path,
+            media_entry,
+            {"start": start, "end": end, "comment": comment},
+            duration=duration,
+        )
         print("recorded " + video_filename + " in series log with comment: " + comment)
 
 
-def _parse_duration(duration):
-    hours, mins, secs = duration.split(":")
-    return float(hours) * 3600 + float(mins) * 60 + float(secs)
-
-
 def play_media(
-    read_input: ReadInput,
+    read_input: "ReadInput",
     uri: str,
     dont_record=False,
     night_mode=False,
@@ -164,16 +251,26 @@ def play_media(
     comment=None,
     title=None,
     position_events=False,
-):
+    player: Optional["Player"] = None,
+    continue_playing=False,
+) -> bool:
+    """
+    Play the media at uri, returns whether the next media in the series at
+    uri should be played when continue_playing is set
+    """
+    from .spotify import listen_to_track
+    from .videos import watch_video
+
     if _is_spotify(uri):
         listen_to_track(read_input, uri)
+        return False
     else:
         db = Db()
         media_path, media_entry = _path_to_media(db, uri)
         media_log_entry = _get_media_entry_for_log(media_path)
 
         start_time = datetime.now()
-        start_position = 0
+        start_position: float = 0
         position: float | int | None = None
 
         if _is_spotify(media_path):
@@ -197,23 +294,37 @@ def play_media(
                     is_audio=True,
                     skip_global_record=True,
                 )
+                return continue_playing and _has_following(
+                    db, media_entry, position, formatted_duration
+                )
+            return False
         else:
-            if media_entry:
-                viewings = media_entry.get("viewings", None)
-                if viewings:
-                    final_viewing = viewings[-1]["end"].split(" at ")[1]
-                    start_position = _parse_duration(final_viewing)
-
-            watch_status = watch_video(
-                read_input,
-                uri,
-                media_path,
-                media_log_entry,
-                start_position,
-                night_mode=night_mode,
-                sub_file=sub_file,
-                position_events=position_events,
-            )
+            if media_entry and media_entry.viewings:
+                start_position = media_entry.viewings[-1].end.position or 0
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                if continue_playing and player and media_entry:
+                    # open the media that follows while this plays
+                    executor.submit(_prefetch_following, player, uri, media_path)
+
+                watch_status = watch_video(
+                    read_input,
+                    uri,
+                    media_path,
+                    media_log_entry,
+                    start_position,
+                    night_mode=night_mode,
+                    sub_file=sub_file,
+                    position_events=position_events,
+                    player=player,
+                )
+
+            if watch_status:
+                _cache_duration(media_path, watch_status[1])
+
+            # closing the window stops playing the series
+            if player is not None and player.session.shutdown:
+                continue_playing = False
 
             if watch_status and not dont_record:
                 position, formatted_duration, end_time = watch_status
@@ -232,15 +343,84 @@ def play_media(
                         comment=comment,
                         title=title,
                     )
+                    return continue_playing and _has_following(
+                        db, media_entry, position, formatted_duration
+                    )
+
+            return False
+
+
+def _has_following(
+    db: Db, media_entry: Optional[SeriesEntry], position, formatted_duration: str
+) -> bool:
+    # whether a series entry was played to the end and there is another entry
+    # to play after it
+    return (
+        media_entry is not None
+        and format_duration(position) == formatted_duration
+        and db.get_next_index_in_series() is not None
+    )
+
+
+def _prefetch_following(player: "Player", path: str, media_path: str) -> None:
+    """
+    Resolve the media that will follow media_path in the series at path and
+    have the player open it while media_path plays. This also loads the
+    series dbs involved so resolving the media again once media_path has been
+    recorded is quick.
+    """
+    try:
+        db = Db()
+        db.load_series(path)
+        following = db.get_following_in_series()
+        if following is None:
+            return
+        if following.alias:
+            Db().load_series(following.alias)
+        following_path = _get_series_media_path(path, following)
+    except (OSError, ValueError):
+        # the media will be resolved again when it is played
+        return
+    if not _is_spotify(following_path):
+        start_position = 0.0
+        if following.viewings:
+            start_position = following.viewings[-1].end.position or 0
+        player.prefetch(media_path, following_path, start_position)
+
+
+def _cache_duration(media_path: str, formatted_duration: Optional[str]) -> None:
+    """
+    Store the duration mpv read so that it doesn't have to be probed again
+    """
+    if formatted_duration is None or not os.path.isfile(media_path):
+        return
+    try:
+        duration = parse_duration(formatted_duration)
+    except ValueError:
+        return
+    probe_cache = ProbeCache(Db.get_probe_cache_path())
+    if probe_cache.get(media_path) != duration:
+        probe_cache.put(media_path, Probe(duration, None))
+
+
+def _get_series_path(uri: str, media_entry: Optional[SeriesEntry]) -> Optional[str]:
+    # the directory the media was played from, so that sessions can be grouped
+    # by series even though only the name of each file is recorded
+    if media_entry:
+        path = os.path.join(uri, media_entry.alias) if media_entry.alias else uri
+        return os.path.abspath(path)
+    elif _is_url(uri) or _is_spotify(uri):
+        return None
+    return os.path.dirname(os.path.abspath(uri))
 
 
 def _record_session(
     db: Db,
-    media_entry: Optional[MediaEntry],
+    media_entry: Optional[SeriesEntry],
     uri: str,
     media_log_entry: str,
     start_time: datetime,
-    start_position: int,
+    start_position: float,
     end_time: datetime,
     position: float | int,
     formatted_duration: str,
@@ -259,17 +439,21 @@ def _record_session(
     else:
         record["video"] = media_log_entry
 
+    series = _get_series_path(uri, media_entry)
+    if series:
+        record["series"] = series
+
     record.update({"duration": formatted_duration, "start": start, "end": end})
 
     if comment:
         record["comment"] = comment
-    elif media_entry and "comment" in media_entry:
-        record["comment"] = media_entry["comment"]
+    elif media_entry and media_entry.comment is not None:
+        record["comment"] = media_entry.comment
 
     if title:
         record["title"] = title
-    elif media_entry and "title" in media_entry:
-        record["title"] = media_entry["title"]
+    elif media_entry and media_entry.title is not None:
+        record["title"] = media_entry.title
 
     if not skip_global_record:
         # append the global record first in case the series update fails due to full
@@ -278,45 +462,88 @@ def _record_session(
         print("recorded media in global record:", media_log_entry)
 
     if media_entry:
-        # reload database in case something was enqueued while the media
-        # was playing
-        db.load_series(uri)
-        media_entry_backup = media_entry
-        media_entry = db.get_next_in_series()
-        if not media_entry or _get_media_path(media_entry) != _get_media_path(
-            media_entry_backup
+        fields = {}
+        if media_entry.duration != parse_duration(formatted_duration):
+            fields["duration"] = formatted_duration
+        if comment:
+            fields["comment"] = comment
+        if title:
+            fields["title"] = title
+
+        # the series is reloaded if something was enqueued or watched by
+        # another process while the media was playing
+        if not db.record_viewing(
+            uri, media_entry, {"start": start, "end": end}, **fields
         ):
             print(
-                "Something changed while playing media, "
+                "Media was removed from the series while playing, "
                 "not recording entry in series record",
                 file=sys.stderr,
             )
             return
-
-        if media_entry.get("duration", None) != formatted_duration:
-            media_entry["duration"] = formatted_duration
-        if comment:
-            media_entry["comment"] = comment
-        if title:
-            media_entry["title"] = title
-        sessions = media_entry.setdefault("viewings", [])
-
-        sessions.append({"start": start, "end": end})
-        db.write_series(uri)
         print("recorded media in series record:", media_log_entry)
 
         if db.aliased_db:
-            # TODO: reload aliased_db in case it has changed?
             next_aliased_entry = db.aliased_db.get_next_in_series()
 
-            media_key = "audio" if is_audio else "video"
-            if next_aliased_entry[media_key] == media_entry[media_key]:  # type: ignore
-                next_aliased_entry["duration"] = formatted_duration
-                aliased_sessions = next_aliased_entry.setdefault("viewings", [])
-                aliased_sessions.append({"start": start, "end": end})
-                aliased_path = media_entry["alias"]
-                db.aliased_db.write_series(aliased_path)
-                print("recorded video in aliased series record:", aliased_path)
+            aliased_path = media_entry.alias
+            if (
+                aliased_path
+                and next_aliased_entry
+                and next_aliased_entry.media == media_entry.media
+            ):
+                if db.aliased_db.record_viewing(
+                    aliased_path,
+                    next_aliased_entry,
+                    {"start": start, "end": end},
+                    duration=formatted_duration,
+                ):
+                    print("recorded video in aliased series record:", aliased_path)
+
+
+def _get_print_log(
+    path: str, ignore_errors: bool, verbose: bool, no_extension_filter: bool, mtime
+) -> Optional[Union[str, dict]]:
+    try:
+        indexed = _lookup_library(path)
+        if indexed:
+            # the media path is only missing when there was an error
+            if indexed.error is not None or indexed.media_path is None:
+                raise ValueError(indexed.error)
+            media_path = indexed.media_path
+        else:
+            # each path gets its own Db as paths are resolved in parallel
+            media_path, _ = _path_to_media(
+                Db(), path, ignore_errors=ignore_errors, verbose=verbose
+            )
+
+        if _is_spotify(media_path):
+            if verbose:
+                return {"audio": media_path}
+            else:
+                return media_path
+        else:
+            if not no_extension_filter and not _is_video(media_path):
+                return None
+
+            filename = os.path.basename(media_path)
+            if verbose:
+                new_log: Dict[str, Union[str, float]] = {
+                    "path": path,
+                    "filename": filename,
+                }
+                if mtime:
+                    if indexed and indexed.mtime is not None:
+                        new_log["mtime"] = indexed.mtime
+                    else:
+                        new_log["mtime"] = os.path.getmtime(media_path)
+                return new_log
+            else:
+                return filename
+    except ValueError as e:
+        if not ignore_errors:
+            raise e
+        return None
 
 
 def print_path_to_media(
@@ -325,39 +552,20 @@ def print_path_to_media(
     verbose=False,
     no_extension_filter=False,
     mtime=False,
+    jobs=1,
 ):
-    db = Db()
-    logs: List[Union[str, dict]] = []
-
-    for path in paths:
-        try:
-            media_path, _ = _path_to_media(
-                db, path, ignore_errors=ignore_errors, verbose=verbose
-            )
-
-            if _is_spotify(media_path):
-                if verbose:
-                    logs.append({"audio": media_path})
-                else:
-                    logs.append(media_path)
-            else:
-                if not no_extension_filter and not _is_video(media_path):
-                    continue
-
-                filename = os.path.basename(media_path)
-                if verbose:
-                    new_log: Dict[str, Union[str, float]] = {
-                        "path": path,
-                        "filename": filename,
-                    }
-                    if mtime:
-                        new_log["mtime"] = os.path.getmtime(media_path)
-                    logs.append(new_log)
-                else:
-                    logs.append(filename)
-        except ValueError as e:
-            if not ignore_errors:
-                raise e
+    def get_log(path):
+        return _get_print_log(path, ignore_errors, verbose, no_extension_filter, mtime)
+
+    # resolving a path is mostly waiting on the filesystem, which is slow on
+    # network mounts, so many paths are resolved at once. map returns the logs
+    # in the order of the paths
+    if jobs > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+            results = list(executor.map(get_log, paths))
+    else:
+        results = list(map(get_log, paths))
+    logs = [log for log in results if log is not None]
 
     if verbose:
         yaml.dump(logs, sys.stdout)
@@ -369,13 +577,10 @@ def print_path_to_media(
 def enqueue_media(queue_path, paths, comment=None, prune=False, title=None):
     db = Db()
     db.load_series(queue_path)
-    new_entries = []
+    new_entries: List[MediaEntry] = []
     queue_media = db.get_series_media_set()
 
-    if prune:
-        db.prune_watched()
-
-    entry_template = {}
+    entry_template: MediaEntry = {}
     if comment:
         entry_template["comment"] = comment
     if title:
@@ -393,7 +598,6 @@ def enqueue_media(queue_path, paths, comment=None, prune=False, title=None):
                 entry["alias"] = alias
             new_entries.append(entry)
             queue_media.add(media)
-            db.add_show_to_series(entry)
 
     for path in paths:
         if _is_url(path) or _is_video(path):
@@ -401,25 +605,54 @@ def enqueue_media(queue_path, paths, comment=None, prune=False, title=None):
         elif _is_spotify(path):
             add_new_entry(path, audio=True)
         elif os.path.isdir(path):
+            indexed = _lookup_library(path)
+            if indexed and indexed.series:
+                if indexed.media is not None and not indexed.alias:
+                    add_new_entry(indexed.media, path)
+                continue
+            elif indexed:
+                if indexed.error is not None or indexed.media_path is None:
+                    raise ValueError(indexed.error)
+                # the library stores absolute paths, build the entry from the
+                # path given as _find_candidate_in_directory does
+                add_new_entry(os.path.join(path, os.path.basename(indexed.media_path)))
+                continue
+
             series_db = Db()
             if series_db.load_series(path):
                 # TODO: skip entries that are already enqueued, e.g.
                 # first queue episode 1, then episode 2
                 next_entry = series_db.get_next_in_series()
-                if next_entry and "alias" not in next_entry:
-                    add_new_entry(_get_media_path(next_entry), path)
+                if next_entry and next_entry.alias is None:
+                    add_new_entry(next_entry.media, path)
             else:
                 video = _find_candidate_in_directory(path)
                 add_new_entry(video)
 
-    if new_entries:
-        db.write_series(queue_path)
+    if prune:
+        # reload the queue in case another process changed it since it was
+        # first loaded, the lock keeps it from changing until it is written
+        with Db.lock_series(queue_path):
+            db.load_series(queue_path)
+            db.prune_watched()
+            queue_media = db.get_series_media_set()
+            new_entries = [
+                entry
+                for entry in new_entries
+                if _get_media_path(entry) not in queue_media
+            ]
+            if new_entries:
+                # pruning rewrites the queue so the new entries may as well
+                # be written with it rather than journaled
+                for entry in new_entries:
+                    db.add_show_to_series(entry)
+                db.write_series(queue_path)
+    elif new_entries:
+        new_entries = db.enqueue_shows(queue_path, new_entries)
     yaml.dump(new_entries, sys.stdout)
 
 
 def dequeue_media(queue_path, paths):
-    db = Db()
-    db.load_series(queue_path)
     media_set = set()
     alias_set = set()
 
@@ -433,35 +666,279 @@ def dequeue_media(queue_path, paths):
                 video = _find_candidate_in_directory(path)
                 media_set.add(video)
 
-    db.filter_db(
-        lambda entry: _get_media_path(entry) not in media_set
-        and entry.get("alias", None) not in alias_set
-    )
-    db.write_series(queue_path)
+    db = Db()
+    with Db.lock_series(queue_path):
+        db.load_series(queue_path)
+        db.filter_db(
+            lambda entry: entry.media not in media_set and entry.alias not in alias_set
+        )
+        db.write_series(queue_path)
 
 
-def grep_media_record(terms, quiet):
+def grep_media_record(query: Query, quiet, jobs=1):
     db = Db()
-    db.load_global_record()
-    matches = db.get_matching_entries(
-        lambda record: all(
-            re.search(term, _get_media_path(record), re.IGNORECASE) for term in terms
-        )
+    has_matches = False
+
+    # print each match as soon as it is found rather than collecting them
+    for match in db.find_in_global_record(query, jobs):
+        has_matches = True
+        if quiet:
+            print(_get_media_path(match), flush=True)
+        else:
+            yaml.dump([match], sys.stdout)
+            sys.stdout.flush()
+
+    if not has_matches and not quiet:
+        yaml.dump([], sys.stdout)
+
+
+def print_global_record_stats(query: Query, jobs=1):
+    totals, series, days = Db().get_global_record_stats(query, jobs)
+
+    def format_stats(sessions, watched, completion, rewatches):
+        return {
+            "sessions": sessions,
+            "watch time": format_duration(watched),
+            "completion": round(completion or 0, 3),
+            "rewatches": int(rewatches),
+        }
+
+    yaml.dump(
+        {
+            "total": format_stats(*totals),
+            "series": [
+                {"name": name, **format_stats(*stats)} for name, *stats in series
+            ],
+            "sessions per day": {day.replace("-", "/"): count for day, count in days},
+        },
+        sys.stdout,
     )
 
-    if quiet:
-        print("\n".join(list(map(_get_media_path, matches))))
-    else:
-        yaml.dump(list(matches), sys.stdout)
 
+def split_global_record():
+    manifest = Db.get_global_record().split()
+    yaml.dump(manifest, sys.stdout)
+
+
+# files written by babies itself that don't change the next media
+_LIBRARY_IGNORED_FILES = {".videos.cursor", ".videos.lock"}
 
-def create_record_from_directory(db: Db, dirpath, force):
-    # TODO: merge new content with old content instead
-    if not force and os.path.isfile(Db.get_series_db_path(dirpath)):
-        raise ValueError("series record already exists")
 
-    for filename in sorted(os.listdir(dirpath)):
-        if _is_video(filename):
-            db.add_show_to_series({"video": filename})
+def _walk_library(root: str):
+    for dirpath, dirnames, filenames in os.walk(root):
+        # skip hidden directories
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
+        yield dirpath
 
-    db.write_series(dirpath)
+
+def _scan_library(library: LibraryIndex, root: str) -> int:
+    """
+    Index every directory under root and forget indexed directories that no
+    longer exist, returns the number of directories indexed
+    """
+    stale = set(library.get_paths_under(root))
+    count = 0
+    for dirpath in _walk_library(root):
+        try:
+            if _update_library_entry(library, dirpath):
+                stale.discard(dirpath)
+                count += 1
+        except OSError:
+            # removed while scanning
+            pass
+    library.remove(stale)
+    return count
+
+
+def _watch_library(library: LibraryIndex, roots: List[str]) -> None:
+    with Inotify() as inotify:
+        watches: Dict[int, str] = {}
+
+        def watch_tree(root: str):
+            for dirpath in _walk_library(root):
+                try:
+                    wd = inotify.add_watch(dirpath, DIRECTORY_EVENTS | IN_ONLYDIR)
+                except OSError as e:
+                    print("could not watch", dirpath, e, file=sys.stderr)
+                    continue
+                watches[wd] = dirpath
+
+        def unwatch_tree(root: str):
+            prefix = os.path.join(root, "")
+            for wd, dirpath in list(watches.items()):
+                if dirpath == root or dirpath.startswith(prefix):
+                    inotify.remove_watch(wd)
+                    del watches[wd]
+            library.remove(library.get_paths_under(root))
+
+        for root in roots:
+            watch_tree(root)
+        print("watching", len(watches), "directories", flush=True)
+
+        while True:
+            events = inotify.read_events()
+            # let bursts of changes, e.g. copying a season, settle so that
+            # each directory is only indexed once for them
+            time.sleep(0.5)
+            events += inotify.read_events(0)
+
+            changed = set()
+            for event in events:
+                if event.mask & IN_Q_OVERFLOW:
+                    # events were lost so the whole library must be checked
+                    for root in roots:
+                        _scan_library(library, root)
+                    continue
+
+                dirpath = watches.get(event.wd, None)
+                if dirpath is None:
+                    continue
+                if event.mask & IN_IGNORED:
+                    del watches[event.wd]
+                    continue
+                if event.mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    unwatch_tree(dirpath)
+                    continue
+                if event.name in _LIBRARY_IGNORED_FILES or event.name.endswith(".tmp"):
+                    continue
+
+                if event.mask & IN_ISDIR:
+                    if event.name.startswith("."):
+                        continue
+                    child = os.path.join(dirpath, event.name)
+                    if event.mask & (IN_CREATE | IN_MOVED_TO):
+                        watch_tree(child)
+                        _scan_library(library, child)
+                    elif event.mask & (IN_DELETE | IN_MOVED_FROM):
+                        unwatch_tree(child)
+                else:
+                    changed.add(dirpath)
+
+            for dirpath in changed:
+                try:
+                    _update_library_entry(library, dirpath)
+                except OSError:
+                    # the directory was removed after the event
+                    library.remove(library.get_paths_under(dirpath))
+                else:
+                    print("indexed", dirpath, flush=True)
+
+
+def index_library(config: "Config", roots: List[str], watch=False):
+    """
+    Index the next media of every directory under roots, or the library roots
+    from the config when none are given, so that commands can avoid loading
+    series. When watch is set the index is kept up to date until interrupted.
+    """
+    if not roots:
+        config.load()
+        roots = config.get_library_roots()
+
+    library = LibraryIndex(Db.get_library_index_path())
+    roots = [os.path.abspath(root) for root in roots]
+    for root in roots:
+        if not os.path.isdir(root):
+            raise ValueError(f"library root {root} is not a directory")
+        print("indexed", _scan_library(library, root), "directories in", root)
+
+    if watch:
+        try:
+            _watch_library(library, roots)
+        except KeyboardInterrupt:
+            pass
+    library.close()
+
+
+def migrate_series(paths, storage_name):
+    storage = STORAGES[storage_name]
+    for path in paths:
+        if not Db.path_has_series_db(path):
+            raise ValueError(f"No series record found at {path}")
+        db = Db()
+        with Db.lock_series(path):
+            db.load_series(path)
+            db.write_series(path, storage)
+        print("stored series record as:", storage.get_path(path))
+
+
+def _scan_videos(dirpath: str, recursive: bool, prefix="") -> Iterator[str]:
+    """
+    Yield the paths of videos in dirpath relative to it, when recursive is set
+    videos in subdirectories other than hidden ones are included
+    """
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if recursive and not entry.name.startswith("."):
+                    yield from _scan_videos(
+                        entry.path, recursive, prefix + entry.name + os.sep
+                    )
+            elif _is_video(entry.name):
+                yield prefix + entry.name
+
+
+def create_record_from_directory(db: Db, dirpath, force, update=False, recursive=False):
+    """
+    Create a series db from the videos in dirpath. When update is set the
+    videos that aren't in the existing series db are added to the end of it
+    instead, keeping the viewings of the existing entries.
+    """
+    with Db.lock_series(dirpath):
+        if update:
+            db.load_series(dirpath)
+        elif not force and Db.path_has_series_db(dirpath):
+            raise ValueError("series record already exists")
+
+        media_set = db.get_series_media_set()
+        videos = [
+            video
+            for video in _scan_videos(dirpath, recursive)
+            if video not in media_set
+        ]
+        # only use durations that are already known as probing every video
+        # would make creating a large series slow, see "babies probe"
+        probe_cache = ProbeCache(Db.get_probe_cache_path())
+        for video in sorted(videos):
+            entry: MediaEntry = {"video": video}
+            duration = (
+                probe_cache.get(os.path.join(dirpath, video))
+                if probe_cache.exists()
+                else None
+            )
+            if duration is not None:
+                entry["duration"] = format_duration(duration)
+            db.add_show_to_series(entry)
+
+        if videos or not update:
+            db.write_series(dirpath)
+
+
+def probe_media(paths: List[str], recursive=False, jobs=1, verbose=False):
+    """
+    Fill the probe cache with the durations of the videos in paths so that
+    recording and creating series don't have to probe them
+    """
+    media_paths: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            media_paths.extend(
+                os.path.join(path, video) for video in _scan_videos(path, recursive)
+            )
+        else:
+            media_paths.append(path)
+
+    probe_cache = ProbeCache(Db.get_probe_cache_path())
+    probed, failed = probe_cache.probe(media_paths, jobs)
+    for path in failed:
+        print("could not probe:", path, file=sys.stderr)
+    print(f"probed {probed} of {len(media_paths)} videos")
+
+    if verbose:
+        probes = {}
+        for path in media_paths:
+            probe = probe_cache.get_probe(path)
+            if probe is not None:
+                probes[path] = {"duration": format_duration(probe.duration)}
+                if probe.tracks is not None:
+                    probes[path]["tracks"] = probe.tracks
+        yaml.dump(probes, sys.stdout)
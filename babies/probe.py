@@ -0,0 +1,154 @@
+import os
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# bump this when the schema changes so that old caches are rebuilt
+SCHEMA_VERSION = 2
+
+
+class Probe(NamedTuple):
+    # duration in seconds
+    duration: float
+    # the "track-list" read by mpv, None when it wasn't recorded
+    tracks: Optional[List[Dict[str, Any]]]
+
+
+def _stat_media(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ProbeCache:
+    """
+    SQLite cache of media durations and tracks, an entry is only used while
+    the size and mtime of the file match those it had when it was probed
+    """
+
+    def __init__(self, cache_path: str):
+        self.__cache_path = cache_path
+        self.__conn: Optional[sqlite3.Connection] = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.__cache_path)
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn is None:
+            conn = sqlite3.connect(self.__cache_path)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript(
+                    f"""
+                    DROP TABLE IF EXISTS probes;
+                    CREATE TABLE probes (
+                        path TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime INTEGER NOT NULL,
+                        duration REAL NOT NULL,
+                        tracks TEXT
+                    );
+                    PRAGMA user_version = {SCHEMA_VERSION};
+                    """
+                )
+            self.__conn = conn
+        return self.__conn
+
+    def close(self) -> None:
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+
+    def get_probe(self, path: str) -> Optional[Probe]:
+        path = os.path.abspath(path)
+        try:
+            size, mtime = _stat_media(path)
+        except OSError:
+            return None
+        row = (
+            self.__connect()
+            .execute(
+                "SELECT duration, tracks FROM probes "
+                "WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return Probe(row[0], None if row[1] is None else json.loads(row[1]))
+
+    def get(self, path: str) -> Optional[float]:
+        probe = self.get_probe(path)
+        return None if probe is None else probe.duration
+
+    def put(self, path: str, probe: Probe, stat: Optional[Tuple[int, int]] = None):
+        """
+        Cache the probe of a file, stat should be taken before the file was
+        probed so that a file that changes while it is probed isn't cached
+        """
+        path = os.path.abspath(path)
+        size, mtime = stat or _stat_media(path)
+        tracks = None if probe.tracks is None else json.dumps(probe.tracks)
+        with self.__connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime, probe.duration, tracks),
+            )
+
+    def get_duration(self, path: str) -> float:
+        """
+        Return the duration of media, probing it when it isn't cached
+        """
+        # mpv is only loaded when something needs probing
+        from .videos import MpvProber
+
+        if not os.path.isfile(path):
+            # e.g. a URL
+            with MpvProber() as prober:
+                return prober.probe(path).duration
+
+        duration = self.get(path)
+        if duration is None:
+            stat = _stat_media(path)
+            with MpvProber() as prober:
+                probe = prober.probe(path)
+            self.put(path, probe, stat)
+            duration = probe.duration
+        return duration
+
+    def probe(self, paths: List[str], jobs=1) -> Tuple[int, List[str]]:
+        """
+        Probe every file in paths that isn't cached using up to jobs mpv
+        instances at once. Returns the number of files probed and the files
+        that couldn't be probed.
+        """
+        from .videos import MpvProber
+
+        uncached = [path for path in paths if self.get(path) is None]
+        if not uncached:
+            return 0, []
+        jobs = max(1, min(jobs, len(uncached)))
+
+        def probe_all(paths: List[str]):
+            # mpv demuxes in its own threads so each worker gets an instance
+            results: List[Tuple[str, Optional[Tuple[int, int]], Optional[Probe]]] = []
+            with MpvProber() as prober:
+                for path in paths:
+                    try:
+                        stat = _stat_media(path)
+                        results.append((path, stat, prober.probe(path)))
+                    except (OSError, ValueError):
+                        # e.g. a missing file or a URL, which isn't cached
+                        results.append((path, None, None))
+            return results
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            chunks = [uncached[idx::jobs] for idx in range(jobs)]
+            for results in executor.map(probe_all, chunks):
+                for path, stat, probe in results:
+                    if probe is None:
+                        failed.append(path)
+                    else:
+                        self.put(path, probe, stat)
+        return len(uncached) - len(failed), failed
@@ -0,0 +1,44 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+
+@dataclass
+class Query:
+    """
+    Filters for global record entries, an entry matches when it passes every
+    filter that is set. Regular expressions are case insensitive, terms must
+    all match the media path.
+    """
+
+    terms: List[str] = field(default_factory=list)
+    title: Optional[str] = None
+    comment: Optional[str] = None
+    # times the viewing session started and ended
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    ended_since: Optional[datetime] = None
+    ended_until: Optional[datetime] = None
+    # duration of the media in seconds
+    longer_than: Optional[float] = None
+    shorter_than: Optional[float] = None
+
+    def get_patterns(self) -> List[tuple[str, re.Pattern]]:
+        """
+        Compile the regular expressions in the query, returned as pairs of
+        the field they are matched against and the pattern
+        """
+        fields = [("media", term) for term in self.terms]
+        if self.title is not None:
+            fields.append(("title", self.title))
+        if self.comment is not None:
+            fields.append(("comment", self.comment))
+
+        patterns = []
+        for name, expression in fields:
+            try:
+                patterns.append((name, re.compile(expression, re.IGNORECASE)))
+            except re.error as err:
+                raise ValueError(f"invalid search term {expression}: {err}")
+        return patterns
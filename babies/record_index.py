@@ -0,0 +1,446 @@
+import os
+import pickle
+import sqlite3
+from hashlib import sha1
+from typing import Iterator, List, Optional, Tuple
+
+from .yaml import (
+    iter_yaml_sequence_batches,
+    load_yaml_sequence_range,
+    split_yaml_sequence,
+)
+from .trigrams import trigrams, required_literals
+from .global_record import Source
+from .formatting import parse_duration, parse_time_with_duration
+from .query import Query
+
+# bump this when the schema changes so that old indexes are rebuilt
+SCHEMA_VERSION = 7
+
+# fields of each entry that are trigram indexed, mapped to the code they are
+# stored with
+TRIGRAM_FIELDS = {"media": 0, "title": 1, "comment": 2}
+
+# the log is read in chunks of this many bytes to fingerprint it
+FINGERPRINT_CHUNK_BYTES = 1024 * 1024
+
+# parsing less than this much of the log isn't worth starting processes for
+PARALLEL_MIN_BYTES = 1024 * 1024
+
+# the log is split into this many chunks per process, smaller chunks spread
+# the work more evenly and limit how many parsed entries are held at once
+CHUNKS_PER_JOB = 4
+
+
+def _get_media_path(entry) -> str:
+    return entry.get("video", None) or entry.get("audio", "")
+
+
+def _stat_source(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _update_fingerprint(fingerprint, path: str, start: int, end: int) -> None:
+    with open(path, "rb") as stream:
+        stream.seek(start)
+        while start < end:
+            chunk = stream.read(min(end - start, FINGERPRINT_CHUNK_BYTES))
+            if not chunk:
+                break
+            fingerprint.update(chunk)
+            start += len(chunk)
+
+
+def _get_trigram_rows(
+    record_id: Optional[int], entry
+) -> Iterator[Tuple[int, str, Optional[int]]]:
+    # record_id is the lastrowid of the record's insert, which sqlite3 types
+    # as optional
+    for field, code in TRIGRAM_FIELDS.items():
+        value = _get_media_path(entry) if field == "media" else entry.get(field, None)
+        if value is not None:
+            for trigram in trigrams(str(value)):
+                yield code, trigram, record_id
+
+
+def _iter_batches(path: str, offset: int, size: int, jobs: int):
+    if jobs <= 1 or size - offset < PARALLEL_MIN_BYTES:
+        yield from iter_yaml_sequence_batches(path, offset, size)
+        return
+
+    # multiprocessing is slow to import and only needed for large logs
+    from concurrent.futures import ProcessPoolExecutor
+
+    ranges = split_yaml_sequence(path, offset, size, jobs * CHUNKS_PER_JOB)
+    with ProcessPoolExecutor(jobs) as executor:
+        # map yields the results in the order of the ranges
+        yield from executor.map(
+            load_yaml_sequence_range, [path] * len(ranges), *zip(*ranges)
+        )
+
+
+def _parse_time_and_position(text) -> Tuple[Optional[float], Optional[float]]:
+    date, duration = parse_time_with_duration(text)
+    try:
+        position = parse_duration(duration)
+    except ValueError:
+        # e.g. "finished?" when the end position wasn't recorded
+        position = None
+    return (date.timestamp() if date else None), position
+
+
+def _get_record_row(source: str, entry) -> tuple:
+    try:
+        duration = parse_duration(str(entry.get("duration", "")))
+    except ValueError:
+        duration = None
+    title = entry.get("title", None)
+    comment = entry.get("comment", None)
+    started, start_position = _parse_time_and_position(entry.get("start", ""))
+    ended, end_position = _parse_time_and_position(entry.get("end", ""))
+    series = entry.get("series", None)
+    return (
+        source,
+        _get_media_path(entry),
+        None if title is None else str(title),
+        None if series is None else str(series),
+        None if comment is None else str(comment),
+        started,
+        ended,
+        start_position,
+        end_position,
+        duration,
+        pickle.dumps(entry),
+    )
+
+
+def _get_range_conditions(query: Query) -> List[Tuple[str, float]]:
+    conditions = []
+    for column, operator, value in (
+        ("started", ">=", query.since),
+        ("started", "<", query.until),
+        ("ended", ">=", query.ended_since),
+        ("ended", "<", query.ended_until),
+    ):
+        if value is not None:
+            conditions.append((f"{column} {operator} ?", value.timestamp()))
+    if query.longer_than is not None:
+        conditions.append(("duration > ?", query.longer_than))
+    if query.shorter_than is not None:
+        conditions.append(("duration < ?", query.shorter_than))
+    return conditions
+
+
+class GlobalRecordIndex:
+    """
+    SQLite index of the global record so that searching it doesn't require
+    parsing the YAML log, each file (or source) the record is stored in is
+    tracked separately
+    """
+
+    def __init__(self, index_path: str):
+        self.__index_path = index_path
+        self.__conn: Optional[sqlite3.Connection] = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.__index_path)
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn is None:
+            conn = sqlite3.connect(self.__index_path)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript(
+                    f"""
+                    DROP TABLE IF EXISTS records;
+                    DROP TABLE IF EXISTS meta;
+                    DROP TABLE IF EXISTS sources;
+                    DROP TABLE IF EXISTS trigrams;
+                    CREATE TABLE records (
+                        id INTEGER PRIMARY KEY,
+                        source TEXT NOT NULL,
+                        media TEXT NOT NULL,
+                        title TEXT,
+                        series TEXT,
+                        comment TEXT,
+                        started REAL,
+                        ended REAL,
+                        start_position REAL,
+                        end_position REAL,
+                        duration REAL,
+                        entry BLOB NOT NULL
+                    );
+                    CREATE INDEX records_source ON records (source, id);
+                    CREATE INDEX records_started ON records (started);
+                    CREATE TABLE trigrams (
+                        field INTEGER NOT NULL,
+                        trigram TEXT NOT NULL,
+                        record INTEGER NOT NULL,
+                        PRIMARY KEY (field, trigram, record)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE sources (
+                        name TEXT PRIMARY KEY,
+                        size INTEGER,
+                        mtime INTEGER,
+                        offset INTEGER,
+                        fingerprint TEXT
+                    );
+                    PRAGMA user_version = {SCHEMA_VERSION};
+                    """
+                )
+            self.__conn = conn
+        return self.__conn
+
+    def close(self) -> None:
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+
+    def __get_source(self, name: str):
+        return (
+            self.__connect()
+            .execute(
+                "SELECT size, mtime, offset, fingerprint FROM sources WHERE name = ?",
+                (name,),
+            )
+            .fetchone()
+        )
+
+    def __remove_source(self, name: str) -> None:
+        conn = self.__connect()
+        conn.execute(
+            "DELETE FROM trigrams WHERE record IN"
+            " (SELECT id FROM records WHERE source = ?)",
+            (name,),
+        )
+        conn.execute("DELETE FROM records WHERE source = ?", (name,))
+        conn.execute("DELETE FROM sources WHERE name = ?", (name,))
+
+    def is_fresh(self, source: Source) -> bool:
+        """
+        True if the index was last updated from the current state of the
+        source
+        """
+        if not self.exists():
+            return False
+        name, path = source
+        stat = _stat_source(path)
+        indexed = self.__get_source(name)
+        return stat is not None and indexed is not None and stat == indexed[:2]
+
+    def __refresh_source(self, source: Source, jobs: int) -> None:
+        if self.is_fresh(source):
+            return
+
+        name, path = source
+        stat = os.stat(path)
+        conn = self.__connect()
+        indexed = self.__get_source(name)
+        fingerprint = sha1()
+
+        if path.endswith(".gz"):
+            # compressed segments are never appended to, so there is nothing
+            # to resume from and the decompressed data is read to the end
+            offset = 0
+            self.__remove_source(name)
+            batches = iter_yaml_sequence_batches(path)
+        else:
+            # the log is append only, if any of the bytes before the indexed
+            # offset have changed then it was edited and must be indexed from
+            # the start, the fingerprint is carried on over what is appended
+            size = stat.st_size
+            offset = indexed[2] if indexed else 0
+            if indexed and offset <= size:
+                _update_fingerprint(fingerprint, path, 0, offset)
+            if not indexed or offset > size or indexed[3] != fingerprint.hexdigest():
+                offset = 0
+                fingerprint = sha1()
+                self.__remove_source(name)
+            batches = _iter_batches(path, offset, size, jobs)
+        start = offset
+
+        for offset, entries in batches:
+            for entry in entries:
+                record_id = conn.execute(
+                    "INSERT INTO records (source, media, title, series, comment,"
+                    " started, ended, start_position, end_position, duration,"
+                    " entry) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    _get_record_row(name, entry),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO trigrams VALUES (?, ?, ?)",
+                    _get_trigram_rows(record_id, entry),
+                )
+
+        digest = None
+        if not path.endswith(".gz"):
+            _update_fingerprint(fingerprint, path, start, offset)
+            digest = fingerprint.hexdigest()
+        conn.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+            (name, stat.st_size, stat.st_mtime_ns, offset, digest),
+        )
+
+    def move_source(self, source: Source) -> None:
+        """
+        Record that an indexed source has been moved to a new file with the
+        same content, e.g. after compressing it, so that it isn't reindexed
+        """
+        name, path = source
+        stat = os.stat(path)
+        conn = self.__connect()
+        with conn:
+            conn.execute(
+                "UPDATE sources SET size = ?, mtime = ?, fingerprint = NULL"
+                " WHERE name = ?",
+                (stat.st_size, stat.st_mtime_ns, name),
+            )
+
+    def refresh(self, sources: List[Source], jobs=1) -> None:
+        """
+        Bring the index up to date with the given sources, only the entries
+        appended since the last refresh are parsed unless a source has been
+        rewritten. When there is a lot to parse it is split between jobs
+        processes.
+        """
+        conn = self.__connect()
+        with conn:
+            for source in sources:
+                self.__refresh_source(source, jobs)
+
+    def forget_sources_except(self, names: List[str]) -> None:
+        """
+        Remove anything indexed from sources that are no longer part of the
+        global record
+        """
+        conn = self.__connect()
+        with conn:
+            for (name,) in conn.execute("SELECT name FROM sources").fetchall():
+                if name not in names:
+                    self.__remove_source(name)
+
+    def __get_candidates_query(self, field: str, terms: List[str]):
+        """
+        Return a query selecting the ids of records containing every trigram
+        that the terms require in the field, or None if the terms don't
+        require any
+        """
+        required = set()
+        for term in terms:
+            for literal in required_literals(term):
+                required.update(trigrams(literal))
+        if not required:
+            return None, []
+
+        placeholders = ", ".join("?" * len(required))
+        return (
+            "SELECT record FROM trigrams"
+            f" WHERE field = {TRIGRAM_FIELDS[field]} AND trigram IN ({placeholders})"
+            f" GROUP BY record HAVING COUNT(*) = {len(required)}"
+        ), list(required)
+
+    def __get_conditions(
+        self, query: Query, sources: Optional[List[str]]
+    ) -> Tuple[str, List]:
+        """
+        Return an SQL WHERE clause selecting the records matching the query
+        along with its parameters
+        """
+        patterns = query.get_patterns()
+        conn = self.__connect()
+        conn.create_function(
+            "babies_match",
+            2,
+            lambda idx, value: value is not None
+            and patterns[idx][1].search(value) is not None,
+            deterministic=True,
+        )
+
+        # the filters are ordered cheapest first: the source and numeric
+        # ranges, then the trigram index narrows down the records that need
+        # to be checked against the regular expressions
+        conditions = []
+        params: List = []
+        if sources is not None:
+            conditions.append(f"source IN ({', '.join('?' * len(sources))})")
+            params += sources
+
+        for condition, value in _get_range_conditions(query):
+            conditions.append(condition)
+            params.append(value)
+
+        for field in TRIGRAM_FIELDS:
+            candidates, candidate_params = self.__get_candidates_query(
+                field,
+                [pattern.pattern for name, pattern in patterns if name == field],
+            )
+            if candidates:
+                conditions.append(f"id IN ({candidates})")
+                params += candidate_params
+
+        conditions += [
+            f"babies_match({idx}, {name})" for idx, (name, _) in enumerate(patterns)
+        ]
+
+        if not conditions:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
+    def find(self, query: Query, sources: Optional[List[str]] = None) -> Iterator:
+        """
+        Yield entries matching the query in the order they were recorded, when
+        sources is given only entries from the named sources are searched
+        """
+        where, params = self.__get_conditions(query, sources)
+        # sources are named so that they sort in the order they were written
+        sql = f"SELECT entry FROM records{where} ORDER BY source, id"
+        for (entry,) in self.__connect().execute(sql, params):
+            yield pickle.loads(entry)
+
+    def get_stats(self, query: Query, sources: Optional[List[str]] = None):
+        """
+        Aggregate the sessions matching the query, returns the totals over
+        every session, the totals for each series (the title of the entries,
+        or the directory they were played from, or the media for entries
+        recorded before directories were) and the number of sessions per day
+        """
+        where, params = self.__get_conditions(query, sources)
+        conn = self.__connect()
+        # the end position isn't known for sessions recorded as finished
+        sessions = f"""
+            SELECT
+                COALESCE(title, series, media) AS series,
+                -- only the file name of local media is recorded, so media
+                -- is only distinct within a series
+                quote(COALESCE(title, series, media)) || quote(media) AS episode,
+                started,
+                duration,
+                MAX(0, COALESCE(end_position, duration) - COALESCE(start_position, 0))
+                    AS watched,
+                COALESCE(end_position, duration) / NULLIF(duration, 0) AS completion,
+                COALESCE(end_position, duration) >= duration - 1 AS completed
+            FROM records{where}
+        """
+        aggregates = """
+            COUNT(*),
+            TOTAL(watched),
+            AVG(completion),
+            TOTAL(completed) - COUNT(DISTINCT CASE WHEN completed THEN episode END)
+        """
+        totals = conn.execute(
+            f"SELECT {aggregates} FROM ({sessions})", params
+        ).fetchone()
+        series = conn.execute(
+            f"SELECT series, {aggregates} FROM ({sessions})"
+            " GROUP BY series ORDER BY TOTAL(watched) DESC",
+            params,
+        ).fetchall()
+        days = conn.execute(
+            "SELECT date(started, 'unixepoch', 'localtime') AS day, COUNT(*)"
+            f" FROM ({sessions}) WHERE started IS NOT NULL GROUP BY day ORDER BY day",
+            params,
+        ).fetchall()
+        return totals, series, days
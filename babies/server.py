@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import socket
+from typing import List, Optional
+
+# subcommands that "babies serve" runs in its own process, so that they share
+# its parsed series and open indexes, and those it runs in a forked process
+SERVED_COMMANDS = {"print", "p", "enqueue", "e", "dequeue", "de", "find", "f"}
+WATCH_COMMANDS = {"watch", "w", "night", "n", "dryrun", "d"}
+
+# sent by the client when it is interrupted
+INTERRUPT = b"\x03"
+
+
+def get_socket_path() -> str:
+    return os.path.expanduser("~/.babies.sock")
+
+
+def _is_watch(argv: List[str]) -> bool:
+    # see run_babies, which plays the current directory without a subcommand
+    # and treats a first argument with a "." as a file to watch
+    return not argv or argv[0] in WATCH_COMMANDS or "." in argv[0]
+
+
+def _is_served(argv: List[str]) -> bool:
+    return _is_watch(argv) or argv[0] in SERVED_COMMANDS
+
+
+def run_in_server(argv: List[str]) -> Optional[int]:
+    """
+    Run a command in "babies serve" and return its exit status, the terminal
+    of this process is passed to the server so that the command reads and
+    writes it directly. Returns None when the server isn't running or
+    doesn't handle the command so that it can be run in this process. Only
+    watch can be interrupted, interrupting another command just stops waiting
+    for it.
+    """
+    if not _is_served(argv):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(get_socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    with sock:
+        try:
+            socket.send_fds(sock, [b"\0"], [0, 1, 2])
+        except OSError:
+            # e.g. EBADF when one of the standard streams is closed
+            return None
+        request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        responses = sock.makefile("rb")
+        while True:
+            try:
+                response = responses.readline()
+                break
+            except KeyboardInterrupt:
+                if not _is_watch(argv):
+                    # other commands run in the server itself, which can't be
+                    # interrupted without stopping it, they are left to finish
+                    return 130
+                sock.sendall(INTERRUPT)
+
+    if not response:
+        print("babies serve stopped while running the command", file=sys.stderr)
+        return 1
+    return json.loads(response)["status"]
+
+
+def _run_command(argv: List[str]) -> int:
+    from .command import run_babies
+
+    try:
+        run_babies(argv)
+    except ValueError as err:
+        # as in bin/babies
+        print(err.args[0], file=sys.stderr)
+    except SystemExit as exit:
+        # e.g. from argparse
+        if isinstance(exit.code, int):
+            return exit.code
+        if exit.code is not None:
+            print(exit.code, file=sys.stderr)
+            return 1
+    return 0
+
+
+def _run_request(fds: List[int], request) -> int:
+    """
+    Run a command with the terminal, working directory and environment of the
+    client, restoring those of the server afterwards
+    """
+    cwd = os.getcwd()
+    environ = dict(os.environ)
+    saved_fds = [os.dup(fd) for fd in range(3)]
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+    try:
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        return _run_command(request["argv"])
+    except Exception:
+        import traceback
+
+        traceback.print_exc()
+        return 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except OSError:
+                # the client went away
+                pass
+        for target, fd in enumerate(saved_fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.environ.clear()
+        os.environ.update(environ)
+        os.chdir(cwd)
+
+
+def serve() -> None:
+    """
+    Run commands sent by bin/babies until interrupted. Commands other than
+    watch run one at a time in this process so that they reuse the series,
+    indexes and modules it has loaded. Each watch runs in a child process
+    forked from this one so that it starts with everything already imported
+    without stopping other commands from running.
+    """
+    import socketserver
+    import threading
+    import signal
+
+    socket_path = get_socket_path()
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            raise ValueError(f"babies is already being served at {socket_path}")
+        except ConnectionRefusedError:
+            # left behind by a server that didn't exit cleanly
+            os.remove(socket_path)
+        finally:
+            probe.close()
+
+    # import everything watch needs now rather than in each child
+    from . import command, input, spotify  # noqa: F401
+
+    try:
+        from . import videos  # noqa: F401
+    except OSError as err:
+        print(f"watch won't be served, could not load libmpv: {err}", file=sys.stderr)
+
+    def forward_interrupt(sock: socket.socket) -> None:
+        while sock.recv(1) == INTERRUPT:
+            os.kill(os.getpid(), signal.SIGINT)
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            _, fds, _, _ = socket.recv_fds(self.request, 1, 3)
+            try:
+                line = self.request.makefile("rb").readline()
+                if not line or len(fds) != 3:
+                    # e.g. checking whether the server is running
+                    return
+                request = json.loads(line)
+                if not _is_watch(request["argv"]):
+                    self.__respond(_run_request(fds, request))
+                elif os.fork() == 0:
+                    self.__run_watch(fds, request)
+            finally:
+                for fd in fds:
+                    os.close(fd)
+
+        def __run_watch(self, fds: List[int], request) -> None:
+            # runs in the forked child, which must never return to the server
+            status = 1
+            try:
+                threading.Thread(
+                    target=forward_interrupt, args=(self.request,), daemon=True
+                ).start()
+                try:
+                    status = _run_request(fds, request)
+                except KeyboardInterrupt:
+                    status = 130
+                self.__respond(status)
+            finally:
+                os._exit(status)
+
+        def __respond(self, status: int) -> None:
+            try:
+                self.request.sendall(json.dumps({"status": status}).encode() + b"\n")
+            except OSError:
+                pass
+
+    class Server(socketserver.UnixStreamServer):
+        def shutdown_request(self, request):
+            # shutting the socket down would also cut off a forked watch from
+            # the client, closing it only affects this process
+            self.close_request(request)
+
+        def service_actions(self):
+            # reap finished watch processes
+            try:
+                while os.waitpid(-1, os.WNOHANG)[0]:
+                    pass
+            except ChildProcessError:
+                pass
+
+    # stop cleanly when run as a service
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    umask = os.umask(0o177)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(umask)
+
+    print(f"serving babies at {socket_path}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
@@ -0,0 +1,88 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from .atomic import open_atomically
+from .yaml import load_yaml_file, save_yaml_file
+
+
+class SeriesStorage(ABC):
+    """
+    A file format that a series db can be stored in
+    """
+
+    def __init__(self, name: str, filename: str):
+        self.name = name
+        self.filename = filename
+
+    def get_path(self, dirpath: str) -> str:
+        return os.path.join(dirpath, self.filename)
+
+    @abstractmethod
+    def load(self, filepath: str) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def save(self, filepath: str, data: List[Dict[str, Any]]) -> None:
+        pass
+
+
+class YamlStorage(SeriesStorage):
+    """
+    Easy to edit by hand but slow to parse
+    """
+
+    def __init__(self):
+        super().__init__("yaml", ".videos.yaml")
+
+    def load(self, filepath: str) -> List[Dict[str, Any]]:
+        return load_yaml_file(filepath) or []
+
+    def save(self, filepath: str, data: List[Dict[str, Any]]) -> None:
+        save_yaml_file(filepath, data)
+
+
+class JsonStorage(SeriesStorage):
+    """
+    Parsed by the C accelerated json module, which is many times faster than
+    parsing YAML
+    """
+
+    def __init__(self):
+        super().__init__("json", ".videos.json")
+
+    def load(self, filepath: str) -> List[Dict[str, Any]]:
+        with open(filepath, "rb") as stream:
+            try:
+                return json.load(stream) or []
+            except json.JSONDecodeError as err:
+                raise ValueError(f"{filepath}: {err}")
+
+    def save(self, filepath: str, data: List[Dict[str, Any]]) -> None:
+        try:
+            # check the data can be stored before replacing the file
+            text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        except TypeError as err:
+            raise ValueError(f"{filepath}: {err}")
+        with open_atomically(filepath, "w") as stream:
+            stream.write(text)
+
+
+# series dbs are looked for in each format in this order
+STORAGES: Dict[str, SeriesStorage] = {
+    storage.name: storage for storage in (JsonStorage(), YamlStorage())
+}
+
+# new series are created in this format
+DEFAULT_STORAGE = STORAGES["yaml"]
+
+
+def find_series_storage(dirpath: str) -> Optional[SeriesStorage]:
+    """
+    Return the storage holding the series db in dirpath if there is one
+    """
+    for storage in STORAGES.values():
+        if os.path.isfile(storage.get_path(dirpath)):
+            return storage
+    return None
@@ -0,0 +1,118 @@
+from typing import List, Set
+
+# characters that re.IGNORECASE treats as equal to an ASCII letter but that
+# str.lower() doesn't map to one
+_EXTRA_FOLDS = str.maketrans({"ı": "i", "ſ": "s"})
+
+# characters that have a special meaning outside of a character class
+_SPECIAL = set(".^$*+?{}[]()|\\")
+
+# the number of characters after \x, \u and \U escapes
+_ESCAPE_LENGTHS = {"x": 2, "u": 4, "U": 8}
+
+
+def fold(text: str) -> str:
+    """
+    Lower case text the same way re.IGNORECASE compares characters
+    """
+    if text.isascii():
+        return text.lower()
+    return "".join(c.lower()[0] for c in text).translate(_EXTRA_FOLDS)
+
+
+def trigrams(text: str) -> Set[str]:
+    folded = fold(text)
+    return {folded[idx : idx + 3] for idx in range(len(folded) - 2)}
+
+
+def _skip_class(pattern: str, idx: int) -> int:
+    # idx points at the opening "[", return the index after the closing "]"
+    idx += 1
+    if idx < len(pattern) and pattern[idx] == "^":
+        idx += 1
+    # a "]" at the start of a class is a literal
+    if idx < len(pattern) and pattern[idx] == "]":
+        idx += 1
+    while idx < len(pattern) and pattern[idx] != "]":
+        idx += 2 if pattern[idx] == "\\" else 1
+    return idx + 1
+
+
+def _skip_escape(pattern: str, idx: int) -> int:
+    # idx points at the backslash, return the index after the escape, skipping
+    # too much only loses literals so every digit of an octal escape or back
+    # reference is skipped
+    escaped = pattern[idx + 1 : idx + 2]
+    idx += 2
+    if escaped in _ESCAPE_LENGTHS:
+        return idx + _ESCAPE_LENGTHS[escaped]
+    elif escaped == "N" and pattern[idx : idx + 1] == "{":
+        close = pattern.find("}", idx)
+        return len(pattern) if close == -1 else close + 1
+    elif escaped.isdigit():
+        while idx < len(pattern) and pattern[idx].isdigit():
+            idx += 1
+    return idx
+
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    Return strings that any text matched by the regular expression must
+    contain, this is conservative and ignores anything that isn't a plain run
+    of ASCII characters outside of a group
+    """
+    # any part of an alternation may match so nothing is required
+    if "|" in pattern:
+        return []
+
+    literals = []
+    current: List[str] = []
+
+    def flush():
+        if current:
+            literals.append(fold("".join(current)))
+            current.clear()
+
+    depth = 0
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if char == "\\":
+            escaped = pattern[idx + 1 : idx + 2]
+            if depth == 0 and escaped.isascii() and escaped in _SPECIAL:
+                current.append(escaped)
+            else:
+                # character classes like \d, back references, etc.
+                flush()
+            idx = _skip_escape(pattern, idx)
+        elif char == "[":
+            flush()
+            idx = _skip_class(pattern, idx)
+        elif char == "(":
+            flush()
+            depth += 1
+            idx += 1
+        elif char == ")":
+            depth -= 1
+            idx += 1
+        elif depth > 0:
+            idx += 1
+        elif char in "*?{":
+            # the preceding character is optional or repeated
+            if current:
+                current.pop()
+            flush()
+            if char == "{":
+                close = pattern.find("}", idx)
+                idx = len(pattern) if close == -1 else close + 1
+            else:
+                idx += 1
+        elif char in ".^$+" or not char.isascii():
+            flush()
+            idx += 1
+        else:
+            current.append(char)
+            idx += 1
+
+    flush()
+    return [literal for literal in literals if len(literal) >= 3]
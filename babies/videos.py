@@ -1,28 +1,281 @@
 import mpv
 import os
 import sys
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 from dataclasses import dataclass
 
 from .yaml import load_yaml_file
 from .logger import MpvLogger
 from .input import ReadInput
 from .formatting import format_duration
+from .probe import Probe
 
 OPTIONS_YAML_FILE = ".watch-options.yaml"
 
+# seconds to wait for mpv to open a file before giving up on it
+PROBE_TIMEOUT = 30
+
+# seconds to wait for mpv to move on to a prefetched video before loading it
+PREFETCH_TIMEOUT = 5
+
+# seconds from the resume position within which playback is considered to
+# have started at it
+START_TOLERANCE = 2
+
 
 @dataclass
 class Session:
     duration: Optional[int]
     position: Optional[float]
+    # whether mpv was shut down, e.g. by closing its window
+    shutdown: bool = False
 
 
-def _apply_watch_options(player, video_path) -> tuple[Optional[str], Optional[str]]:
-    run_before = None
-    run_after = None
+# raised by python-mpv when a property can't be read or written
+_PROPERTY_ERRORS = (AttributeError, RuntimeError, TypeError, ValueError)
+
+
+def _get_option(player: mpv.MPV, name: str):
+    """
+    Return the value of an option from options/<name>, or its default when
+    the value can't be read
+    """
+    try:
+        value = player[name]
+    except _PROPERTY_ERRORS:
+        value = None
+    if value is None:
+        try:
+            value = (player.option_info(name) or {}).get("default-value")
+        except _PROPERTY_ERRORS:
+            pass
+    return value
+
+
+def _can_prefetch(video_path: str, next_video_path: str) -> bool:
+    # mpv opens a prefetched video with the options of the current one, which
+    # are only those of the next one when both are in the same directory, and
+    # commands to run before or after a video can't run between the two
+    if os.path.dirname(video_path) != os.path.dirname(next_video_path):
+        return False
+    options = _load_watch_options(video_path)
+    return "before" not in options and "after" not in options
+
+
+class Player:
+    """
+    An mpv instance that is reused to watch several videos one after another
+    so that the window, video output and decoders are only set up once.
+    Options are set through the player so that those set for one video can be
+    reset before the next.
+    """
+
+    def __init__(self):
+        self.logger = MpvLogger()
+        self.session = Session(None, None)
+        self.__mpv: Optional[mpv.MPV] = None
+        # values of options before they were changed for the current video
+        self.__originals: Dict[str, Any] = {}
+        # options set for the current video and for the last one
+        self.__values: Dict[str, Any] = {}
+        self.__previous: Dict[str, Any] = {}
+        # the video mpv will play when the current one ends
+        self.__prefetched: Optional[str] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self) -> None:
+        if self.__mpv is not None:
+            self.__mpv.terminate()
+            self.__mpv = None
+
+    def get_mpv(self) -> mpv.MPV:
+        if self.__mpv is None or self.__mpv.core_shutdown:
+            # e.g. the window was closed during the last video
+            self.__mpv = self.__create_mpv()
+            self.__originals.clear()
+            self.__values.clear()
+            self.__previous.clear()
+            self.__prefetched = None
+        return self.__mpv
+
+    def __create_mpv(self) -> mpv.MPV:
+        player = mpv.MPV(
+            log_handler=self.logger,
+            input_default_bindings=True,
+            input_vo_keyboard=True,
+            fullscreen=True,
+            osc=True,
+            # keep the window open between videos
+            idle=True,
+            force_window=True,
+            # open the next video in the playlist before the current one ends
+            prefetch_playlist=True,
+        )
+
+        @player.on_key_press("Q")
+        @player.on_key_press("q")
+        def quit_binding():
+            self.session.position = player.time_pos
+            # end the video but keep the player for the next one, this also
+            # removes any prefetched video from the playlist
+            self.__prefetched = None
+            player.stop()
+
+        return player
+
+    def __setitem__(self, name: str, value) -> None:
+        player = self.get_mpv()
+        if name not in self.__originals:
+            self.__originals[name] = _get_option(player, name)
+        self.__values[name] = value
+        # a prefetched video is already playing with the options of the last
+        # one, leave those that haven't changed alone
+        if name not in self.__previous or self.__previous[name] != value:
+            player[name] = value
+
+    def prefetch(
+        self, video_path: str, next_video_path: str, start_position: float = 0
+    ) -> None:
+        """
+        Add next_video_path to the playlist while video_path is playing so that
+        mpv opens it before video_path ends and moves straight on to it, from
+        start_position
+        """
+        player = self.__mpv
+        if player is None or player.core_shutdown:
+            return
+        if not _can_prefetch(video_path, next_video_path):
+            return
+        try:
+            # the next video may be resolved before the current one is loaded
+            player.wait_for_property(
+                "path", lambda path: path == video_path, timeout=PREFETCH_TIMEOUT
+            )
+        except (TimeoutError, mpv.ShutdownError):
+            return
+        # only keeps the current video
+        player.playlist_clear()
+        _load_video(player, next_video_path, start_position, "append")
+        self.__prefetched = next_video_path
+
+    def take_prefetched(self, video_path: str) -> bool:
+        """
+        Whether mpv was left to move on to video_path from the last video
+        """
+        prefetched = self.__prefetched == video_path
+        self.__prefetched = None
+        return prefetched
+
+    def reset(self) -> None:
+        """
+        Start a new session, the options set for the last video are kept
+        until restore_options is called
+        """
+        self.session = Session(None, None)
+        self.logger.suspend()
+        self.__previous = self.__values
+        self.__values = {}
+
+    def restore_options(self) -> None:
+        """
+        Restore the options set for the last video that haven't been set
+        again since reset
+        """
+        previous = self.__previous
+        self.__previous = {}
+        if self.__mpv is None or self.__mpv.core_shutdown:
+            return
+
+        for name in previous:
+            if name not in self.__values:
+                try:
+                    self.__mpv[name] = self.__originals.pop(name)
+                except _PROPERTY_ERRORS:
+                    pass
+        self.__mpv.pause = False
+
+
+class MpvProber:
+    """
+    Reads the duration and tracks of media with a headless mpv instance that
+    is reused for every file, which is much cheaper than running ffprobe for
+    each one. The tracks aren't decoded, only the container is read.
+    """
+
+    def __init__(self):
+        self.__player = mpv.MPV(
+            vo="null",
+            ao="null",
+            vid="no",
+            aid="no",
+            sid="no",
+            pause=True,
+            idle=True,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
 
+    def close(self) -> None:
+        self.__player.terminate()
+
+    def probe(self, path: str) -> Probe:
+        player = self.__player
+
+        def is_loaded(event):
+            event_id = event.event_id.value
+            if event_id == mpv.MpvEventID.FILE_LOADED:
+                return "loaded"
+            elif event_id == mpv.MpvEventID.END_FILE:
+                return "failed"
+
+        try:
+            with player.prepare_and_wait_for_event(
+                "file-loaded", "end-file", cond=is_loaded, timeout=PROBE_TIMEOUT
+            ) as result:
+                player.loadfile(path)
+        except TimeoutError:
+            # wait for the file to be closed so that its end-file isn't taken
+            # for that of the next file probed
+            with player.prepare_and_wait_for_event("end-file", timeout=PROBE_TIMEOUT):
+                player.stop()
+            raise ValueError(f"timed out opening {path}")
+
+        if result.result() != "loaded":
+            raise ValueError(f"could not open {path}")
+
+        duration = player.duration
+        tracks = [
+            {key: value for key, value in track.items() if key != "id"}
+            for track in player.track_list
+        ]
+        with player.prepare_and_wait_for_event("end-file", timeout=PROBE_TIMEOUT):
+            player.stop()
+
+        if duration is None:
+            raise ValueError(f"could not read duration of {path}")
+        return Probe(duration, tracks)
+
+
+def _load_video(player: mpv.MPV, video_path: str, start_position: float, mode):
+    if start_position > 0:
+        # starting at the position avoids decoding the opening then seeking
+        player.loadfile(video_path, mode, start=start_position)
+    else:
+        player.loadfile(video_path, mode)
+
+
+def _load_watch_options(video_path: str) -> Dict[str, Any]:
     video_dir = os.path.dirname(video_path)
 
     options = {}
@@ -35,7 +288,14 @@ def _apply_watch_options(player, video_path) -> tuple[Optional[str], Optional[st
     if os.path.isfile(options_path):
         options.update(load_yaml_file(options_path))
 
-    for opt_name, opt_val in options.items():
+    return options
+
+
+def _apply_watch_options(player, video_path) -> tuple[Optional[str], Optional[str]]:
+    run_before = None
+    run_after = None
+
+    for opt_name, opt_val in _load_watch_options(video_path).items():
         if opt_name == "before":
             run_before = opt_val
         elif opt_name == "after":
@@ -56,9 +316,10 @@ def register_pause_handler(player):
             print("pause: " + ("paused" if value else "resumed"), flush=True)
 
     player.observe_property("pause", pause_handler)
+    return pause_handler
 
 
-def __log_position_events(player: mpv.MPV) -> None:
+def __log_position_events(player: mpv.MPV):
     last_pos = {"value": 0}
 
     @player.property_observer("time-pos")
@@ -70,25 +331,54 @@ def __log_position_events(player: mpv.MPV) -> None:
                 print("pos:", rounded, flush=True)
                 last_pos["value"] = value
 
+    return time_observer
+
+
+def __log_first_frame(player: mpv.MPV, start_position: float, started: float):
+    state = {"logged": False}
+
+    @player.property_observer("time-pos")
+    def first_frame_observer(_name, value):
+        if (
+            not state["logged"]
+            and value is not None
+            and abs(value - start_position) < START_TOLERANCE
+        ):
+            state["logged"] = True
+            print(f"first-frame: {time.monotonic() - started:.3f}", flush=True)
+
+    return first_frame_observer
+
 
 def watch_video(
     read_input: ReadInput,
     path: str,
     video_path: str,
     display_video: str,
-    start_position: int,
+    start_position: float,
     night_mode=False,
     sub_file=None,
     position_events=False,
+    player: Optional[Player] = None,
 ) -> Optional[tuple[float | int | None, str, datetime]]:
-    logger = MpvLogger()
-    player = mpv.MPV(
-        log_handler=logger,
-        input_default_bindings=True,
-        input_vo_keyboard=True,
-        fullscreen=True,
-        osc=True,
-    )
+    if player is None:
+        with Player() as player:
+            return watch_video(
+                read_input,
+                path,
+                video_path,
+                display_video,
+                start_position,
+                night_mode=night_mode,
+                sub_file=sub_file,
+                position_events=position_events,
+                player=player,
+            )
+
+    player.reset()
+    logger = player.logger
+    session = player.session
+
     if night_mode:
         # player['af'] = 'dynaudnorm=f=100:p=0.66'
         # player['af'] = 'dynaudnorm=f=150:g=15'
@@ -97,24 +387,39 @@ def watch_video(
     if sub_file:
         player["sub-files"] = sub_file
 
-    session = Session(None, None)
-
-    @player.on_key_press("Q")
-    @player.on_key_press("q")
-    def quit_binding():
-        session.position = player.time_pos
-        player.quit(0)
-
-    if position_events:
-        __log_position_events(player)
-
     run_before, run_after = _apply_watch_options(player, video_path)
+    player.restore_options()
     formatted_duration = None
 
-    try:
-        player.play(video_path)
+    observers = []
+    mpv_player = player.get_mpv()
+    if position_events:
+        observers.append(("time-pos", __log_position_events(mpv_player)))
 
-        player.wait_until_playing()
+    try:
+        prefetched = player.take_prefetched(video_path)
+        if prefetched:
+            try:
+                mpv_player.wait_for_property(
+                    "path", lambda path: path == video_path, timeout=PREFETCH_TIMEOUT
+                )
+            except TimeoutError:
+                # e.g. the last video ended before the prefetch was added
+                prefetched = False
+        if not prefetched:
+            if position_events:
+                # time from loading the video until a frame at the resume
+                # position, a prefetched video was opened before it was
+                # played so there is nothing to time
+                observers.append(
+                    (
+                        "time-pos",
+                        __log_first_frame(mpv_player, start_position, time.monotonic()),
+                    )
+                )
+            _load_video(mpv_player, video_path, start_position, "replace")
+
+        mpv_player.wait_until_playing()
         duration_obj = {}
 
         def set_duration(x):
@@ -122,7 +427,8 @@ def watch_video(
                 duration_obj["value"] = x
                 return True
 
-        player.wait_for_property("duration", set_duration, False)
+        # the duration of a prefetched video may already be known
+        mpv_player.wait_for_property("duration", set_duration, prefetched)
         duration = duration_obj["value"]
 
         # let the user know what they are watching before any other logs
@@ -139,11 +445,15 @@ def watch_video(
             os.system(run_before)
 
         session.duration = duration
-        # once the duration has been read it seems to be safe to seek
-        if start_position > 0:
-            player.seek(start_position, "absolute", "exact")
-
-        player.show_text(
+        # fall back to seeking when the start option was ignored, e.g. by
+        # some streams, once the duration has been read it seems to be safe
+        time_pos = mpv_player.time_pos
+        if start_position > 0 and (
+            time_pos is None or abs(time_pos - start_position) >= START_TOLERANCE
+        ):
+            mpv_player.seek(start_position, "absolute", "exact")
+
+        mpv_player.show_text(
             display_video
             + " ("
             + format_duration(start_position)
@@ -154,22 +464,24 @@ def watch_video(
             1,
         )
 
-        register_pause_handler(player)
+        observers.append(("pause", register_pause_handler(mpv_player)))
         if read_input.is_tty:
-            read_input.start(lambda key: player.command("keypress", key))
+            read_input.start(lambda key: mpv_player.command("keypress", key))
         else:
 
             def read_non_tty_input(line: str):
                 if len(line) == 1:
-                    player.command("keypress", line)
+                    mpv_player.command("keypress", line)
                 elif " " in line:
                     cmd, param = line.split(" ")
+                    # through the player so that these are reset for the next
+                    # video
                     if cmd == "aid":
                         player["aid"] = param
                     elif cmd == "sid":
                         player["sid"] = param
                     elif cmd == "seek":
-                        player.seek(float(param), "absolute", "exact")
+                        mpv_player.seek(float(param), "absolute", "exact")
                     else:
                         print(f"unrecognised command {cmd}", file=sys.stderr)
                 else:
@@ -179,12 +491,15 @@ def watch_video(
 
         # wait for video to end
         try:
-            player.wait_for_playback()
+            mpv_player.wait_for_playback()
         except mpv.ShutdownError:
-            pass
+            session.shutdown = True
 
     finally:
         read_input.stop()
+        if not mpv_player.core_shutdown:
+            for name, observer in observers:
+                mpv_player.unobserve_property(name, observer)
         if run_after:
             os.system(run_after)
 
@@ -1,22 +1,201 @@
+import os
+import gzip
+import threading
 from ruamel.yaml import YAML, YAMLError
 
-yaml = YAML(typ="safe")
-yaml.default_flow_style = False
-yaml.width = 1000  # type: ignore
-yaml.sort_base_mapping_type_on_output = False  # type: ignore
+from .atomic import open_atomically
+
+
+def _create_yaml() -> YAML:
+    yaml = YAML(typ="safe")
+    yaml.default_flow_style = False
+    yaml.width = 1000  # type: ignore
+    yaml.sort_base_mapping_type_on_output = False  # type: ignore
+    return yaml
+
+
+yaml = _create_yaml()
+
+# YAML objects keep the state of the document being loaded or dumped so they
+# can't be shared between threads
+_thread_yaml = threading.local()
+
+
+def _get_yaml() -> YAML:
+    if threading.current_thread() is threading.main_thread():
+        return yaml
+    if not hasattr(_thread_yaml, "yaml"):
+        _thread_yaml.yaml = _create_yaml()
+    return _thread_yaml.yaml
 
 
 def load_yaml_file(filepath):
     with open(filepath, "r") as stream:
         try:
-            return yaml.load(stream)
+            return _get_yaml().load(stream)
         except YAMLError as err:
             raise ValueError(*err.args)
 
 
-def save_yaml_file(filepath, data, mode="w"):
-    with open(filepath, mode) as stream:
+def _truncate_partial_item(filepath) -> None:
+    """
+    Remove the last item of a sequence in a YAML file when it was cut short
+    while it was appended, appends always end with a newline
+    """
+    try:
+        with open(filepath, "rb") as stream:
+            stream.seek(-1, os.SEEK_END)
+            if stream.read(1) == b"\n":
+                return
+            stream.seek(0)
+            data = stream.read()
+    except OSError:
+        # missing or empty
+        return
+    start = 0 if data.startswith(b"- ") else data.rfind(b"\n- ") + 1
+    os.truncate(filepath, start)
+
+
+def save_yaml_file(filepath, data, mode="w", sync=True):
+    """
+    Write data to a YAML file, when overwriting the data is written to a
+    temporary file which then replaces filepath. The file is synced to disk
+    unless sync is False.
+    """
+    if mode == "a":
+        _truncate_partial_item(filepath)
+    opened = (
+        open_atomically(filepath, sync=sync) if mode == "w" else open(filepath, mode)
+    )
+    with opened as stream:
+        try:
+            _get_yaml().dump(data, stream)
+        except YAMLError as err:
+            raise ValueError(*err.args)
+        if mode != "w" and sync:
+            stream.flush()
+            os.fsync(stream.fileno())
+
+
+def load_yaml_sequence_file(filepath) -> list:
+    """
+    Load the top level block sequence in a YAML file that is appended to,
+    items that can't be parsed or were cut short while they were appended,
+    e.g. by a crash or a full disk, are skipped
+    """
+    with open(filepath, "rb") as stream:
+        data = stream.read()
+    if not data:
+        return []
+    if data.endswith(b"\n"):
+        try:
+            return _get_yaml().load(data.decode("utf-8")) or []
+        except (YAMLError, UnicodeDecodeError):
+            pass
+
+    items = []
+
+    def load_item(lines):
+        if not lines[-1].endswith(b"\n"):
+            return
         try:
-            return yaml.dump(data, stream)
+            item = _get_yaml().load(b"".join(lines).decode("utf-8"))
+        except (YAMLError, UnicodeDecodeError):
+            return
+        if isinstance(item, list):
+            items.extend(item)
+
+    lines: list[bytes] = []
+    for line in data.splitlines(keepends=True):
+        if _is_sequence_item_start(line) and lines:
+            load_item(lines)
+            lines = []
+        lines.append(line)
+    load_item(lines)
+    return items
+
+
+# parse this much of a sequence at a time, this avoids paying the cost of
+# creating a loader for each item while keeping memory use bounded
+SEQUENCE_BATCH_BYTES = 64 * 1024
+
+
+def open_binary(filepath):
+    """
+    Open a file for reading in binary mode, files ending in .gz are
+    decompressed as they are read
+    """
+    if filepath.endswith(".gz"):
+        return gzip.open(filepath, "rb")
+    return open(filepath, "rb")
+
+
+def _is_sequence_item_start(line: bytes) -> bool:
+    return line.startswith(b"- ") or line.rstrip(b"\r\n") == b"-"
+
+
+def iter_yaml_sequence_batches(filepath, offset=0, end=None):
+    """
+    Yield batches of items from the top level block sequence in a YAML file
+    along with the byte offset at which the batch ends, reading starts at
+    offset (which must be the start of an item) and stops at end. Offsets in
+    compressed files refer to the decompressed data.
+    """
+
+    def load_batch(batch):
+        try:
+            return _get_yaml().load(b"".join(batch).decode("utf-8")) or []
         except YAMLError as err:
             raise ValueError(*err.args)
+
+    with open_binary(filepath) as stream:
+        stream.seek(offset)
+        batch: list[bytes] = []
+        batch_size = 0
+        for line in stream:
+            if end is not None and offset + batch_size >= end:
+                break
+            if batch_size >= SEQUENCE_BATCH_BYTES and _is_sequence_item_start(line):
+                offset += batch_size
+                yield offset, load_batch(batch)
+                batch = []
+                batch_size = 0
+            batch.append(line)
+            batch_size += len(line)
+
+        if batch:
+            yield offset + batch_size, load_batch(batch)
+
+
+def load_yaml_sequence_range(filepath, start, end):
+    """
+    Return the byte offset where parsing stopped and the items of the top
+    level block sequence between start and end
+    """
+    items = []
+    for start, batch in iter_yaml_sequence_batches(filepath, start, end):
+        items.extend(batch)
+    return start, items
+
+
+def split_yaml_sequence(filepath, start, end, count):
+    """
+    Split the byte range of a top level block sequence in a YAML file into up
+    to count ranges that each begin at the start of an item
+    """
+    boundaries = [start]
+    with open(filepath, "rb") as stream:
+        for idx in range(1, count):
+            target = start + (end - start) * idx // count
+            stream.seek(target)
+            # skip the remainder of the line the target landed in
+            stream.readline()
+            position = stream.tell()
+            while position < end:
+                if _is_sequence_item_start(stream.readline()):
+                    if position > boundaries[-1]:
+                        boundaries.append(position)
+                    break
+                position = stream.tell()
+    boundaries.append(end)
+    return list(zip(boundaries, boundaries[1:]))
@@ -0,0 +1,68 @@
+"""
+Time indexing a synthetic global record with a varying number of processes
+and check that every job count finds the same entries, run from the
+repository root with:
+
+    poetry run python benchmarks/find_jobs.py [entries]
+
+At least two jobs are always run so that the parallel path is compared
+against the serial one even on a single core.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from babies.query import Query
+from babies.record_index import GlobalRecordIndex
+
+
+def write_record(path: str, entries: int) -> None:
+    with open(path, "w") as stream:
+        for idx in range(entries):
+            day = f"2024/{1 + idx % 12:02d}/{1 + idx % 28:02d}"
+            stream.write(
+                f"- video: Show {idx % 500} S{idx % 9:02d}E{idx % 24:02d}.mkv\n"
+                "  duration: 0:42:10.500\n"
+                f"  start: {day} 20:00:00.000000 at 0:00:00.0\n"
+                f"  end: {day} 20:42:10.000000 at 0:42:10.500\n"
+            )
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        record_path = os.path.join(tmpdir, "record.yaml")
+        write_record(record_path, entries)
+        index_path = os.path.join(tmpdir, "record.sqlite")
+
+        baseline = None
+        expected = None
+        jobs = 1
+        while jobs <= max(2, os.cpu_count() or 1):
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            index = GlobalRecordIndex(index_path)
+            start = time.perf_counter()
+            index.refresh([("record.yaml", record_path)], jobs)
+            found = list(index.find(Query(["show 42 ", "s03"])))
+            elapsed = time.perf_counter() - start
+            index.close()
+
+            if expected is None:
+                expected = found
+            assert found == expected, f"jobs={jobs} found different entries"
+            matches = len(found)
+
+            baseline = baseline or elapsed
+            print(
+                f"jobs: {jobs}, entries: {entries}, matches: {matches}, "
+                f"time: {elapsed:.2f}s, speedup: {baseline / elapsed:.2f}x",
+                flush=True,
+            )
+            jobs *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Time importing the command line interface with "python -X importtime" and
+fail when a heavy dependency is imported by it, run from the repository root
+with:
+
+    poetry run python benchmarks/import_time.py [budget_ms]
+
+When budget_ms is given the best of several runs must also be within it.
+"""
+
+import os
+import sys
+import subprocess
+
+# only the subcommands that use these should import them
+LAZY_MODULES = ("mpv", "Xlib", "dbus_next", "requests", "xdg", "readchar")
+
+RUNS = 5
+
+
+def import_time_us() -> int:
+    """
+    Return the cumulative time in microseconds taken to import babies.command
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import babies.command"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    for line in output.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        _, cumulative, name = line.split("|")
+        if name.strip() == "babies.command":
+            return int(cumulative)
+    raise ValueError("babies.command was not imported")
+
+
+def imported_lazy_modules():
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, babies.command; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    modules = set(output.split())
+    return [module for module in LAZY_MODULES if module in modules]
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    os.environ["PYTHONPATH"] = os.getcwd()
+
+    best = min(import_time_us() for _ in range(RUNS)) / 1000
+    print(f"import babies.command: {best:.1f}ms")
+
+    failed = False
+    imported = imported_lazy_modules()
+    if imported:
+        print("imported eagerly:", ", ".join(imported))
+        failed = True
+    if budget is not None and best > budget:
+        print(f"over budget of {budget:.1f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
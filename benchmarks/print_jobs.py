@@ -0,0 +1,82 @@
+"""
+Time printing the next show of many synthetic series with a varying number
+of threads, run from the repository root with:
+
+    poetry run python benchmarks/print_jobs.py [series] [latency_ms]
+
+latency_ms delays each series db read to simulate a network mount.
+"""
+
+import io
+import os
+import sys
+import time
+import tempfile
+from contextlib import redirect_stdout
+
+import babies.db
+from babies.media import print_path_to_media
+from babies.storage import YamlStorage
+from babies.yaml import save_yaml_file
+
+
+def write_series(dirpath: str, episodes: int) -> None:
+    os.makedirs(dirpath)
+    entries = []
+    for idx in range(episodes):
+        filename = f"E{idx:02d}.mkv"
+        open(os.path.join(dirpath, filename), "w").close()
+        entry = {"video": filename, "duration": "0:42:10.500"}
+        if idx < episodes // 2:
+            entry["viewings"] = [
+                {
+                    "start": "2024/01/01 20:00:00.000000 at 0:00:00.0",
+                    "end": "2024/01/01 20:42:10.000000 at 0:42:10.500",
+                }
+            ]
+        entries.append(entry)
+    save_yaml_file(os.path.join(dirpath, ".videos.yaml"), entries)
+
+
+def main():
+    series = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+
+    load = YamlStorage.load
+
+    def slow_load(self, filepath):
+        time.sleep(latency)
+        return load(self, filepath)
+
+    YamlStorage.load = slow_load  # type: ignore
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = [os.path.join(tmpdir, f"show{idx}") for idx in range(series)]
+        for path in paths:
+            write_series(path, 24)
+
+        baseline = None
+        expected = None
+        for jobs in (1, 2, 4, 8, 16, 32):
+            # measure reading the series rather than the process wide cache
+            babies.db._series_cache.clear()
+            output = io.StringIO()
+            start = time.perf_counter()
+            with redirect_stdout(output):
+                print_path_to_media(paths, verbose=True, mtime=True, jobs=jobs)
+            elapsed = time.perf_counter() - start
+
+            # the output must not depend on the number of threads
+            expected = expected or output.getvalue()
+            assert output.getvalue() == expected
+
+            baseline = baseline or elapsed
+            print(
+                f"jobs: {jobs}, series: {series}, time: {elapsed:.2f}s, "
+                f"speedup: {baseline / elapsed:.2f}x",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
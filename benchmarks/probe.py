@@ -0,0 +1,66 @@
+"""
+Compare reading the durations of the videos in a directory by running ffprobe
+for each one against reusing a headless mpv instance, run from the
+repository root with:
+
+    poetry run python benchmarks/probe.py <directory>
+
+Both ffprobe and libmpv must be installed.
+"""
+
+import os
+import sys
+import time
+from subprocess import check_output
+
+from babies.videos import MpvProber
+
+
+def ffprobe_duration(path: str) -> float:
+    return float(
+        check_output(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration",
+                "-of",
+                "default=noprint_wrappers=1:nokey=1",
+                path,
+            ]
+        )
+    )
+
+
+def main():
+    dirpath = sys.argv[1]
+    paths = sorted(
+        os.path.join(dirpath, name)
+        for name in os.listdir(dirpath)
+        if os.path.isfile(os.path.join(dirpath, name))
+    )
+
+    start = time.perf_counter()
+    ffprobe_durations = [ffprobe_duration(path) for path in paths]
+    ffprobe_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with MpvProber() as prober:
+        mpv_durations = [prober.probe(path).duration for path in paths]
+    mpv_time = time.perf_counter() - start
+
+    for path, expected, duration in zip(paths, ffprobe_durations, mpv_durations):
+        if abs(expected - duration) > 0.1:
+            print(f"durations differ for {path}: {expected} {duration}")
+
+    count = len(paths)
+    print(f"ffprobe: {ffprobe_time / count * 1000:.1f}ms per file")
+    print(
+        f"mpv:     {mpv_time / count * 1000:.1f}ms per file"
+        f" ({ffprobe_time / mpv_time:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Time loading a synthetic series db stored in each storage format, run from
+the repository root with:
+
+    poetry run python benchmarks/series_load.py [entries]
+"""
+
+import sys
+import time
+import tempfile
+
+from babies.db import Db
+from babies.storage import STORAGES
+
+
+def make_series(entries: int):
+    series = []
+    for idx in range(entries):
+        day = f"2024/{1 + idx % 12:02d}/{1 + idx % 28:02d}"
+        series.append(
+            {
+                "video": f"Show S{idx // 24:02d}E{idx % 24:02d}.mkv",
+                "duration": "0:42:10.500",
+                "viewings": [
+                    {
+                        "start": f"{day} 20:00:00.000000 at 0:00:00.0",
+                        "end": f"{day} 20:30:00.000000 at 0:30:00.0",
+                    },
+                    {
+                        "start": f"{day} 21:00:00.000000 at 0:30:00.0",
+                        "end": f"{day} 21:12:10.000000 at 0:42:10.500",
+                    },
+                ],
+            }
+        )
+    return series
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    series = make_series(entries)
+
+    baseline = None
+    for storage in (STORAGES["yaml"], STORAGES["json"]):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storage.save(storage.get_path(tmpdir), series)
+
+            start = time.perf_counter()
+            storage.load(storage.get_path(tmpdir))
+            parsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            db = Db()
+            db.load_series(tmpdir)
+            db.get_next_index_in_series()
+            elapsed = time.perf_counter() - start
+
+            baseline = baseline or elapsed
+            print(
+                f"format: {storage.name}, entries: {entries}, "
+                f"parse: {parsed:.3f}s, load: {elapsed:.3f}s, "
+                f"speedup: {baseline / elapsed:.2f}x",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
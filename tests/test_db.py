@@ -0,0 +1,107 @@
+import pytest
+
+import babies.db
+from babies.db import Db
+from babies.storage import YamlStorage
+
+START = "2024/01/02 03:04:05 at 0:00:00.0"
+END = "2024/01/02 03:29:05 at 0:25:00.0"
+
+
+@pytest.fixture(autouse=True)
+def series_cache(monkeypatch):
+    # each test loads the series dbs it writes from disk
+    monkeypatch.setattr(babies.db, "_series_cache", {})
+
+
+def _write_series(dirpath, entries):
+    storage = YamlStorage()
+    storage.save(storage.get_path(str(dirpath)), entries)
+    return str(dirpath)
+
+
+def _load_series(dirpath) -> Db:
+    babies.db._series_cache.clear()
+    db = Db()
+    assert db.load_series(dirpath)
+    return db
+
+
+def test_journal_replay_is_idempotent(tmp_path):
+    path = _write_series(
+        tmp_path,
+        [{"video": "e1.mkv", "duration": "0:25:00.0"}, {"video": "e2.mkv"}],
+    )
+    db = _load_series(path)
+    db.record_viewing(path, db.get_next_in_series(), {"start": START, "end": END})
+    db.enqueue_shows(path, [{"video": "e3.mkv"}])
+
+    journal_path = Db.get_series_journal_path(path)
+    with open(journal_path) as stream:
+        journal = stream.read()
+
+    # a compaction interrupted after writing the series db leaves the journal
+    # it was made from behind
+    db.write_series(path)
+    expected = YamlStorage().load(Db.get_series_db_path(path))
+    with open(journal_path, "w") as stream:
+        stream.write(journal)
+
+    db = _load_series(path)
+    assert db.get_next_in_series().media == "e2.mkv"
+    db.write_series(path)
+    assert YamlStorage().load(Db.get_series_db_path(path)) == expected
+    assert [entry["video"] for entry in expected] == ["e1.mkv", "e2.mkv", "e3.mkv"]
+    assert len(expected[0]["viewings"]) == 1
+
+
+def test_journal_with_a_partial_append(tmp_path):
+    path = _write_series(
+        tmp_path,
+        [{"video": "e1.mkv", "duration": "0:25:00.0"}, {"video": "e2.mkv"}],
+    )
+    db = _load_series(path)
+    db.enqueue_shows(path, [{"video": "e3.mkv"}])
+    db.record_viewing(path, db.get_next_in_series(), {"start": START, "end": END})
+
+    # an append cut short by a crash or a full disk
+    journal_path = Db.get_series_journal_path(path)
+    with open(journal_path, "a") as stream:
+        stream.write('- enqueue:\n    video: e4.mkv\n- enqueue:\n    video: "e5')
+
+    db = _load_series(path)
+    assert db.get_series_media_set() == {"e1.mkv", "e2.mkv", "e3.mkv", "e4.mkv"}
+    assert db.get_next_in_series().media == "e2.mkv"
+
+    # the partial item is removed before appending
+    db.enqueue_shows(path, [{"video": "e6.mkv"}])
+    db = _load_series(path)
+    assert "e6.mkv" in db.get_series_media_set()
+    assert "e5.mkv" not in db.get_series_media_set()
+    with open(journal_path) as stream:
+        assert '"e5' not in stream.read()
+
+
+@pytest.mark.parametrize(
+    "viewed,following",
+    [
+        # the following entry skips those already finished
+        ([], "e2.mkv"),
+        (["e1.mkv"], "e3.mkv"),
+        (["e2.mkv"], "e3.mkv"),
+        (["e1.mkv", "e3.mkv"], "e4.mkv"),
+        (["e1.mkv", "e2.mkv", "e3.mkv"], None),
+        (["e1.mkv", "e2.mkv", "e3.mkv", "e4.mkv"], None),
+    ],
+)
+def test_get_following_in_series(tmp_path, viewed, following):
+    entries = []
+    for idx in range(1, 5):
+        entry = {"video": f"e{idx}.mkv", "duration": "0:25:00.0"}
+        if entry["video"] in viewed:
+            entry["viewings"] = [{"start": START, "end": END}]
+        entries.append(entry)
+    db = _load_series(_write_series(tmp_path, entries))
+
+    entry = db.get_following_in_series()
+    assert (entry and entry.media) == following
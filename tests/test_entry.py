@@ -0,0 +1,79 @@
+import pytest
+
+from babies.entry import SeriesEntry
+
+ENTRIES = [
+    {"video": "e1.mkv"},
+    {
+        "video": "e2.mkv",
+        "title": "the second",
+        "duration": "0:25:00.0",
+        "viewings": [
+            {
+                "start": "2024/01/02 03:04:05 at 0:00:00.0",
+                "end": "2024/01/02 03:29:05 at 0:25:00.0",
+                "comment": "again",
+            }
+        ],
+        "rating": 5,
+    },
+    {"audio": "spotify:track:1", "alias": "../music", "comment": "loud"},
+    # fields that can't be reproduced from what is parsed are kept as written
+    {
+        "video": "e3.mkv",
+        "duration": "25 minutes",
+        "viewings": [{"start": "sometime", "end": "sometime at finished?"}],
+    },
+    # the order fields were written in and null fields are kept
+    {"comment": None, "video": "e4.mkv", "title": None},
+    {"duration": "0:25:00.0", "viewings": [], "rating": None, "video": "e5.mkv"},
+]
+
+
+@pytest.mark.parametrize("data", ENTRIES)
+def test_round_trip(data):
+    written = SeriesEntry.from_dict(data).to_dict()
+    assert written == data
+    assert list(written) == list(data)
+
+
+def test_updated_fields_follow_those_written():
+    entry = SeriesEntry.from_dict({"video": "e1.mkv", "comment": None})
+    entry.update({"duration": "0:25:00.0", "comment": "good"})
+    assert list(entry.to_dict().items()) == [
+        ("video", "e1.mkv"),
+        ("comment", "good"),
+        ("duration", "0:25:00.0"),
+    ]
+
+
+def _entry(end, duration="0:25:00.0"):
+    viewings = [] if end is None else [{"start": "", "end": end}]
+    return SeriesEntry.from_dict(
+        {"video": "e1.mkv", "duration": duration, "viewings": viewings}
+    )
+
+
+@pytest.mark.parametrize(
+    "entry,finished",
+    [
+        (_entry(None), False),
+        (_entry("2024/01/02 03:29:05 at 0:25:00.0"), True),
+        (_entry("2024/01/02 03:14:05 at 0:10:00.0"), False),
+        (_entry("sometime at finished?"), True),
+        (_entry("sometime"), False),
+    ],
+)
+def test_is_finished(entry, finished):
+    assert entry.is_finished() == finished
+
+
+def test_is_finished_uses_last_viewing():
+    entry = _entry("2024/01/02 03:29:05 at 0:25:00.0")
+    entry.update(
+        {
+            "viewings": [v.to_dict() for v in entry.viewings]
+            + [{"start": "", "end": "2024/01/03 03:14:05 at 0:10:00.0"}]
+        }
+    )
+    assert not entry.is_finished()
@@ -0,0 +1,39 @@
+import threading
+
+from babies.lock import _held_locks, lock_file
+
+
+def test_lock_is_reentrant(tmp_path):
+    path = str(tmp_path / "lock")
+    with lock_file(path):
+        with lock_file(path):
+            # taking the lock through another descriptor would block here
+            pass
+        with lock_file(path):
+            pass
+    assert not _held_locks
+
+
+def test_lock_excludes_other_threads(tmp_path):
+    path = str(tmp_path / "lock")
+    events = []
+    locked = threading.Event()
+
+    def other_thread():
+        locked.wait()
+        with lock_file(path):
+            events.append("other")
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    with lock_file(path):
+        locked.set()
+        with lock_file(path):
+            # the other thread is still waiting after the inner lock exits
+            pass
+        thread.join(0.2)
+        assert thread.is_alive()
+        events.append("main")
+    thread.join()
+    assert events == ["main", "other"]
+    assert not _held_locks
@@ -0,0 +1,70 @@
+import os
+
+from babies.query import Query
+from babies.record_index import GlobalRecordIndex
+
+ENTRY = """- video: {media}
+  duration: 0:25:00.0
+  start: 2024/01/02 03:04:05 at 0:00:00.0
+  end: 2024/01/02 03:29:05 at 0:25:00.0
+"""
+
+
+def _write_log(path, media, mode="w"):
+    with open(path, mode) as stream:
+        stream.write("".join(ENTRY.format(media=name) for name in media))
+
+
+def _find(index, source, term):
+    index.refresh([source])
+    return [entry["video"] for entry in index.find(Query([term]))]
+
+
+def test_appended_entries_are_indexed(tmp_path):
+    log_path = str(tmp_path / "log.yaml")
+    source = ("log", log_path)
+    index = GlobalRecordIndex(str(tmp_path / "index.sqlite"))
+    _write_log(log_path, [f"ep{idx:04}.mkv" for idx in range(300)])
+    assert _find(index, source, "ep0299") == ["ep0299.mkv"]
+
+    _write_log(log_path, ["ep0300.mkv"], "a")
+    assert _find(index, source, "ep0300") == ["ep0300.mkv"]
+    assert len(_find(index, source, "ep")) == 301
+
+
+def test_edited_entries_are_reindexed(tmp_path):
+    log_path = str(tmp_path / "log.yaml")
+    source = ("log", log_path)
+    index = GlobalRecordIndex(str(tmp_path / "index.sqlite"))
+    media = [f"ep{idx:04}.mkv" for idx in range(300)]
+    _write_log(log_path, media)
+    assert _find(index, source, "ep0001") == ["ep0001.mkv"]
+
+    # an edit far from the end that doesn't change the size of the log
+    stat = os.stat(log_path)
+    media[1] = "xx0001.mkv"
+    _write_log(log_path, media)
+    os.utime(log_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert os.path.getsize(log_path) == stat.st_size
+    assert _find(index, source, "ep0001") == []
+    assert _find(index, source, "xx0001") == ["xx0001.mkv"]
+
+
+def test_rewatches_are_counted_per_series(tmp_path):
+    log_path = str(tmp_path / "log.yaml")
+    with open(log_path, "w") as stream:
+        for series in ("/media/a", "/media/b", "/media/b"):
+            stream.write(ENTRY.format(media="01.mkv"))
+            stream.write(f"  series: {series}\n")
+    index = GlobalRecordIndex(str(tmp_path / "index.sqlite"))
+    index.refresh([("log", log_path)])
+
+    totals, series, _ = index.get_stats(Query())
+    sessions, _, _, rewatches = totals
+    assert (sessions, rewatches) == (3, 1)
+    assert sorted(
+        (name, count, rewatches) for name, count, _, _, rewatches in series
+    ) == [
+        ("/media/a", 1, 0),
+        ("/media/b", 2, 1),
+    ]
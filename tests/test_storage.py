@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+
+from babies.storage import STORAGES, SeriesStorage, find_series_storage
+
+SERIES = [
+    {"video": "e1.mkv", "duration": "0:25:00.0"},
+    {
+        "video": "e2 – ünïcode.mkv",
+        "title": "the second",
+        "viewings": [
+            {
+                "start": "2024/01/02 03:04:05 at 0:00:00.0",
+                "end": "2024/01/02 03:29:05 at 0:25:00.0",
+            }
+        ],
+        "rating": 5,
+    },
+    {"audio": "spotify:track:1", "alias": "../music", "comment": None},
+]
+
+
+@pytest.mark.parametrize("name", STORAGES)
+def test_round_trip(tmp_path, name):
+    storage = STORAGES[name]
+    path = storage.get_path(str(tmp_path))
+    storage.save(path, SERIES)
+    assert storage.load(path) == SERIES
+    assert find_series_storage(str(tmp_path)) is storage
+
+
+@pytest.mark.parametrize("name", STORAGES)
+def test_load_empty(tmp_path, name):
+    storage = STORAGES[name]
+    path = storage.get_path(str(tmp_path))
+    storage.save(path, [])
+    assert storage.load(path) == []
+
+
+def test_json_save_keeps_file_on_error(tmp_path):
+    storage = STORAGES["json"]
+    path = storage.get_path(str(tmp_path))
+    storage.save(path, SERIES)
+    with pytest.raises(ValueError):
+        storage.save(path, [{"video": "e1.mkv", "date": datetime.date.today()}])
+    assert storage.load(path) == SERIES
+
+
+def test_series_storage_is_abstract():
+    with pytest.raises(TypeError):
+        SeriesStorage("none", ".videos.none")  # type: ignore[abstract]
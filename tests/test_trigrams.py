@@ -0,0 +1,55 @@
+import re
+
+import pytest
+
+from babies.trigrams import fold, required_literals, trigrams
+
+
+@pytest.mark.parametrize(
+    "pattern,literals",
+    [
+        ("foo bar", ["foo bar"]),
+        ("FOO", ["foo"]),
+        (r"\.mkv$", [".mkv"]),
+        ("abc(def)ghi", ["abc", "ghi"]),
+        ("[abc]def", ["def"]),
+        ("foo*bar", ["bar"]),
+        ("x{2}yzw", ["yzw"]),
+        (r"episode\d+ name", ["episode", " name"]),
+        # the characters of escapes aren't literals
+        (r"\x41bcd", ["bcd"]),
+        (r"\101bcd", ["bcd"]),
+        (r"\u0041bcd", ["bcd"]),
+        (r"\U00000041bcd", ["bcd"]),
+        (r"\N{LATIN CAPITAL LETTER A}bcd", ["bcd"]),
+        (r"(ab)\12bcd", ["bcd"]),
+        # too short to be looked up by trigram
+        ("ab", []),
+        # either side of an alternation may match
+        ("foo|bar", []),
+    ],
+)
+def test_required_literals(pattern, literals):
+    assert required_literals(pattern) == literals
+
+
+@pytest.mark.parametrize(
+    "pattern,text",
+    [
+        ("show.s01e0[1-3]", "Show.S01E02.mkv"),
+        ("fo+bar", "fooooBAR"),
+        ("abc?def", "abdef"),
+        (r"(?:some|other) episode\.mkv", "other Episode.mkv"),
+        ("ſeries", "SERIES 1"),
+        (r"\x4fther", "Other.mkv"),
+        (r"\117ther", "Other.mkv"),
+        (r"\u004fther", "Other.mkv"),
+        (r"(o)\1ther", "Oother.mkv"),
+    ],
+)
+def test_required_literals_are_in_matches(pattern, text):
+    assert re.search(pattern, text, re.IGNORECASE)
+    folded = fold(text)
+    for literal in required_literals(pattern):
+        assert literal in folded
+        assert trigrams(literal) <= trigrams(text)